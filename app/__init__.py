@@ -1,13 +1,16 @@
 import os
 import boto3
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from app.database import RoutingSQLAlchemy, configure_database
+from app.log import configure_logging
+from app.pg_manager import PostgresManager, is_postgres_url
+
 # Initialize application
 app = Flask(__name__, static_folder=None)
 
@@ -18,18 +21,29 @@ CORS(app)
 app_configuration = os.getenv('APP_CONFIGURATION', 'app.config.DevelopmentConfig')
 app.config.from_object(app_configuration)
 
+# Logging configuration
+configure_logging(app)
+
 # Initialize Bcrypt
 bcrypt = Bcrypt(app)
 
-# Initialize Flask Sql Alchemy
-db = SQLAlchemy(app)
+# Initialize Flask Sql Alchemy with the pool and driver configuration
+configure_database(app)
+db = RoutingSQLAlchemy(app)
+
+# Initialize SocketIO, sharing rooms between workers through a message queue when configured
+socketio_message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+socketio_channel = app.config.get('SOCKETIO_CHANNEL')
 
-# Initialize SocketIO
-sockets = SocketIO(app)
+if is_postgres_url(socketio_message_queue):
+    sockets = SocketIO(app, client_manager=PostgresManager(socketio_message_queue, channel=socketio_channel))
+else:
+    sockets = SocketIO(app, message_queue=socketio_message_queue, channel=socketio_channel)
 
 # Initialize S3 Storage
 s3 = boto3.client(
    "s3",
+   endpoint_url=app.config.get('S3_ENDPOINT_URL'),
    aws_access_key_id=os.getenv('BUCKETEER_AWS_ACCESS_KEY_ID'),
    aws_secret_access_key=os.getenv('BUCKETEER_AWS_SECRET_ACCESS_KEY')
 )
@@ -70,6 +84,10 @@ from app.uploads.views import uploads
 
 app.register_blueprint(uploads)
 
+from app.metrics.views import metrics
+
+app.register_blueprint(metrics)
+
 from app.docs.views import docs
 
 app.register_blueprint(docs)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, abort
 from app.auth.helper import token_required
+from app.cache import cached_response
 from app.activity.helper import response, response_for_activity, response_for_activities, get_activity_json_list
 from app.models import Activity
 
@@ -9,6 +10,7 @@ activity = Blueprint('activity', __name__)
 
 @activity.route('/activities', methods=['GET'])
 @token_required
+@cached_response()
 def activities(current_user):
     """
     Return all the grounds owned by the user or limit them to 10.
@@ -21,6 +23,7 @@ def activities(current_user):
 
 @activity.route('/activities/<activity_id>', methods=['GET'])
 @token_required
+@cached_response()
 def get_activity(current_user, activity_id):
     """
     Return an activity object for the supplied activity id.
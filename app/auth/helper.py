@@ -75,3 +75,18 @@ def response_auth(status, token, status_code):
         'status': status,
         'auth_token': token.decode("utf-8")
     })), status_code
+
+
+def response_rate_limited(message, retry_after):
+    """
+    Make a Http 429 response telling the client when to retry
+    :param message: Message
+    :param retry_after: Seconds until the next allowed attempt
+    :return: Http Json response
+    """
+    http_response = make_response(jsonify({
+        'status': 'failed',
+        'message': message
+    }), 429)
+    http_response.headers['Retry-After'] = str(retry_after)
+    return http_response
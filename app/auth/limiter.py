@@ -0,0 +1,204 @@
+import datetime
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import request
+from sqlalchemy import select, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import app, db, app_sheduler
+from app.models import login_buckets_table
+
+PRUNE_LOGIN_BUCKETS_JOB_ID = 'prune_login_buckets'
+
+
+class TokenBucketLimiter(object):
+    """
+    Token buckets keyed by a string, e.g. an email or a client address.
+    Every attempt takes one token, tokens are refilled at a constant rate up to the capacity.
+    Buckets are kept in process memory, or in the login_buckets table when shared is set,
+    so that all workers enforce the same limit.
+    """
+
+    def __init__(self, capacity, refill_seconds, shared=False, max_keys=10000):
+        """
+        :param capacity: Attempts allowed in a burst
+        :param refill_seconds: Seconds to get one attempt back
+        :param shared: Keep the buckets in the database
+        :param max_keys: Buckets kept in memory, least recently used are dropped
+        """
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.shared = shared
+        self.max_keys = max_keys
+
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key):
+        """
+        Take a token from the bucket of the key.
+        :param key: Bucket key
+        :return: 0 if the attempt is allowed, otherwise seconds until the next token
+        """
+        now = datetime.datetime.utcnow()
+        if self.shared:
+            return self._take_shared(key, now)
+
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (self.capacity, now))
+            tokens, retry_after = self._refill_and_take(tokens, updated_at, now)
+
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+        return retry_after
+
+    def _take_shared(self, key, now):
+        with db.engine.begin() as connection:
+            connection.execute(pg_insert(login_buckets_table)
+                               .values(key=key, tokens=self.capacity, updated_at=now)
+                               .on_conflict_do_nothing())
+
+            row = connection.execute(select([login_buckets_table.c.tokens, login_buckets_table.c.updated_at])
+                                     .where(login_buckets_table.c.key == key)
+                                     .with_for_update()).first()
+            tokens, retry_after = self._refill_and_take(row.tokens, row.updated_at, now)
+
+            connection.execute(login_buckets_table.update()
+                               .where(login_buckets_table.c.key == key)
+                               .values(tokens=tokens, updated_at=now))
+
+        return retry_after
+
+    def _refill_and_take(self, tokens, updated_at, now):
+        elapsed = max((now - updated_at).total_seconds(), 0)
+        tokens = min(self.capacity, tokens + elapsed / self.refill_seconds)
+
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, int(math.ceil((1 - tokens) * self.refill_seconds))
+
+
+class UnknownEmails(object):
+    """
+    Short-lived cache of emails without an account, so repeated logins with them
+    skip the rate limiter and the user query. Entries are kept in process memory,
+    or in the login_buckets table when shared is set, so that a registration in
+    one worker removes the entry for all of them. Entries expire after the ttl.
+    """
+
+    def __init__(self, ttl, shared=False, max_keys=10000):
+        """
+        :param ttl: Seconds an email is remembered as unknown
+        :param shared: Keep the entries in the database
+        :param max_keys: Entries kept in memory, least recently used are dropped
+        """
+        self.ttl = ttl
+        self.shared = shared
+        self.max_keys = max_keys
+
+        self.lock = threading.Lock()
+        self.emails = OrderedDict()
+
+    @staticmethod
+    def _key(email):
+        return 'unknown:' + email
+
+    def __contains__(self, email):
+        if self.shared:
+            added_after = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl)
+            with db.engine.connect() as connection:
+                return connection.execute(select([login_buckets_table.c.key])
+                                          .where(and_(login_buckets_table.c.key == self._key(email),
+                                                      login_buckets_table.c.updated_at > added_after))).first() is not None
+
+        with self.lock:
+            added_at = self.emails.get(email)
+            if added_at is None:
+                return False
+
+            if time.time() - added_at >= self.ttl:
+                del self.emails[email]
+                return False
+
+            return True
+
+    def add(self, email):
+        if self.shared:
+            now = datetime.datetime.utcnow()
+            with db.engine.begin() as connection:
+                connection.execute(pg_insert(login_buckets_table)
+                                   .values(key=self._key(email), tokens=0, updated_at=now)
+                                   .on_conflict_do_update(index_elements=[login_buckets_table.c.key],
+                                                          set_={'updated_at': now}))
+            return
+
+        with self.lock:
+            self.emails[email] = time.time()
+            self.emails.move_to_end(email)
+            while len(self.emails) > self.max_keys:
+                self.emails.popitem(last=False)
+
+    def discard(self, email):
+        if self.shared:
+            with db.engine.begin() as connection:
+                connection.execute(login_buckets_table.delete().where(login_buckets_table.c.key == self._key(email)))
+            return
+
+        with self.lock:
+            self.emails.pop(email, None)
+
+
+def client_address():
+    """
+    Address of the client as appended to X-Forwarded-For by the first of the
+    TRUSTED_PROXY_COUNT proxies in front of the app. Entries before it are sent
+    by the client and can be forged.
+    :return:
+    """
+    proxy_count = app.config['TRUSTED_PROXY_COUNT']
+    forwarded_for = request.headers.getlist('X-Forwarded-For')
+    if proxy_count <= 0 or not forwarded_for:
+        return request.remote_addr
+
+    route = [address.strip() for address in ','.join(forwarded_for).split(',')]
+    if len(route) < proxy_count:
+        return request.remote_addr
+    return route[-proxy_count]
+
+
+def prune_login_buckets():
+    """
+    Delete shared buckets which have been refilled to capacity, and with them
+    the expired unknown emails.
+    """
+    refilled_before = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=max(email_limiter.capacity * email_limiter.refill_seconds,
+                    address_limiter.capacity * address_limiter.refill_seconds))
+
+    with db.engine.begin() as connection:
+        connection.execute(login_buckets_table.delete().where(login_buckets_table.c.updated_at < refilled_before))
+
+
+email_limiter = TokenBucketLimiter(
+    app.config['LOGIN_LIMIT_EMAIL_ATTEMPTS'],
+    app.config['LOGIN_LIMIT_EMAIL_REFILL_SECONDS'],
+    app.config['LOGIN_LIMIT_SHARED']
+)
+
+address_limiter = TokenBucketLimiter(
+    app.config['LOGIN_LIMIT_ADDRESS_ATTEMPTS'],
+    app.config['LOGIN_LIMIT_ADDRESS_REFILL_SECONDS'],
+    app.config['LOGIN_LIMIT_SHARED']
+)
+
+unknown_emails = UnknownEmails(
+    app.config['LOGIN_UNKNOWN_EMAIL_TTL_SECONDS'],
+    app.config['LOGIN_LIMIT_SHARED']
+)
+
+if app.config['LOGIN_LIMIT_SHARED'] and app.config['SCHEDULE_PERIODIC_JOBS']:
+    app_sheduler.add_job(func=prune_login_buckets, trigger='interval', hours=1, id=PRUNE_LOGIN_BUCKETS_JOB_ID, coalesce=True, replace_existing=True)
@@ -1,8 +1,9 @@
-from app import bcrypt
+from app.hashing import password_hasher
 from flask import Blueprint, request
 from flask.views import MethodView
 from app.models import User, BlackListToken
-from app.auth.helper import response, response_auth
+from app.auth.helper import response, response_auth, response_rate_limited
+from app.auth.limiter import email_limiter, address_limiter, unknown_emails, client_address
 from sqlalchemy import exc
 from app.auth.helper import token_required
 from dateutil.parser import isoparse
@@ -51,6 +52,7 @@ class RegisterUser(MethodView):
                 user = User.get_by_email(email)
                 if not user:
                     token = User(email, password, name, surname, birthday).save()
+                    unknown_emails.discard(email)
                     return response_auth('success', token, 201)
                 else:
                     return response('failed', 'Failed, User already exists, Please sign In', 400)
@@ -69,10 +71,22 @@ class LoginUser(MethodView):
             email = post_data.get('email')
             password = post_data.get('password')
             if re.match(r"[^@]+@[^@]+\.[^@]+", email) and len(password) > 4:
+                retry_after = address_limiter.take('address:' + client_address())
+                if retry_after:
+                    return response_rate_limited('Too many login attempts, try again later', retry_after)
+
+                if email in unknown_emails:
+                    return response('failed', 'User does not exist', 401)
+
+                retry_after = email_limiter.take('email:' + email)
+                if retry_after:
+                    return response_rate_limited('Too many login attempts, try again later', retry_after)
+
                 user = User.query.filter_by(email=email).first()
                 if not user:
+                    unknown_emails.add(email)
                     return response('failed', 'User does not exist', 401)
-                if user and bcrypt.check_password_hash(user.password, password):
+                if user and password_hasher.check_password_hash(user.password, password):
                     return response_auth('success', user.encode_auth_token(user.id), 200)
                 return response('failed', 'Password is incorrect', 400)
             return response('failed', 'Missing or wrong email format or password is less than four characters', 401)
@@ -114,7 +128,7 @@ def reset_password(current_user):
         password_confirmation = data.get('passwordConfirmation')
         if not old_password or not new_password or not password_confirmation:
             return response('failed', "Missing required attributes", 400)
-        if bcrypt.check_password_hash(current_user.password, old_password.encode('utf-8')):
+        if password_hasher.check_password_hash(current_user.password, old_password.encode('utf-8')):
             if not new_password == password_confirmation:
                 return response('failed', 'New Passwords do not match', 400)
             if not len(new_password) > 4:
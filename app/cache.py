@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from hashlib import md5
+from flask import request, g
+from app import app
+
+DATASET_SCOPE = 'dataset'
+
+
+def ground_scope(ground_id):
+    return 'ground:%s' % ground_id
+
+
+class ResponseCache(object):
+    """
+    In-process cache of serialized responses.
+    Keys carry the generation numbers of the scopes the response depends on, so bumping
+    a generation makes all the depending entries unreachable until they are evicted.
+    Generations are kept per worker, entries also expire after the ttl to bound how long
+    a worker serves responses outdated by writes handled in other workers.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+
+    def generation(self, scope):
+        return self.generations.get(scope, 0)
+
+    def bump(self, scope):
+        """
+        Invalidate the cached responses depending on the scope.
+        :param scope: Scope name
+        """
+        with self.lock:
+            self.generations[scope] = self.generations.get(scope, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if time.time() - entry[0] >= self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_set(self, key, create):
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+        return value
+
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_TTL_SECONDS'])
+
+
+def cached_response(scope_arg=None):
+    """
+    Decorator caching successful responses of a read-only view by endpoint, view arguments
+    and query string. Responses carry an ETag, so clients revalidating with If-None-Match
+    get a 304 without the body.
+    Stacked under conditional the key also carries the resource modification time, so
+    the cached body never lags behind the validators sent with it.
+    :param scope_arg: View argument holding the ground id the response depends on
+    :return:
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            scopes = [DATASET_SCOPE]
+            if scope_arg:
+                scopes.append(ground_scope(kwargs.get(scope_arg)))
+
+            key = (
+                request.endpoint,
+                tuple(sorted(request.view_args.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                tuple(map(response_cache.generation, scopes)),
+                g.get('resource_modified_at')
+            )
+
+            entry = response_cache.get(key)
+            if entry is None:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+                body = response.get_data()
+                entry = (body, response.mimetype, md5(body).hexdigest())
+                response_cache.set(key, entry)
+
+            body, mimetype, etag = entry
+            response = app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            return response.make_conditional(request)
+
+        return decorated_function
+
+    return decorator
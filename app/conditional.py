@@ -0,0 +1,82 @@
+from functools import wraps
+from hashlib import md5
+from flask import request, g
+from app import app
+
+
+def conditional(modified_at_of, per_user=False):
+    """
+    Decorator answering conditional GET requests from the modification time of the
+    resource before the view loads and serializes it.
+    The ETag is derived from the endpoint, view arguments, query string and modification
+    time, and from the viewer's id for views whose output depends on the viewer. The
+    modification time has to cover every resource the output is built from.
+    :param modified_at_of: Function of the view argument returning the resource
+        modification time, or None if the resource cannot be found
+    :param per_user: Whether the view output depends on the current user
+    :return:
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(current_user, *args, **kwargs):
+            try:
+                modified_at = modified_at_of(*kwargs.values())
+            except ValueError:
+                modified_at = None
+
+            if modified_at is None:
+                return f(current_user, *args, **kwargs)
+
+            validator = '|'.join([
+                request.endpoint,
+                repr(sorted(request.view_args.items())),
+                repr(sorted(request.args.items(multi=True))),
+                modified_at.isoformat(),
+                str(current_user.id) if per_user else ''
+            ])
+            etag = md5(validator.encode('utf-8')).hexdigest()
+
+            # Last-Modified has a precision of one second, the ETag keeps the full time
+            last_modified = modified_at.replace(microsecond=0)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and \
+                    last_modified <= request.if_modified_since.replace(tzinfo=None)
+
+            if not_modified:
+                response = app.response_class(status=304)
+            else:
+                # Lets cached_response key the cached body on the same modification time
+                g.resource_modified_at = modified_at
+                try:
+                    response = app.make_response(f(current_user, *args, **kwargs))
+                finally:
+                    g.pop('resource_modified_at', None)
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+def add_body_etag(response):
+    """
+    Give successful JSON GET responses without validators an ETag hashed from the body,
+    and answer matching If-None-Match requests with a 304 without the body.
+    :param response: Response
+    :return:
+    """
+    if request.method != 'GET' or response.status_code != 200 or response.mimetype != 'application/json':
+        return response
+
+    if response.direct_passthrough or 'ETag' in response.headers:
+        return response
+
+    response.set_etag(md5(response.get_data()).hexdigest())
+    return response.make_conditional(request)
@@ -1,4 +1,5 @@
 import os
+from app.log import parse_levels
 
 base_dir = os.path.abspath(os.path.dirname(__file__))
 postgres_local_base = 'postgresql://localhost/'
@@ -12,17 +13,86 @@ class Config(object):
     DEBUG = False
     SECRET_KEY = os.getenv('SECRET_KEY', 'my_strong_key')
     BCRYPT_HASH_PREFIX = 14
+    # bcrypt calls running at once per worker, the others wait in a queue
+    HASHING_MAX_CONCURRENCY = 4
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = False
+    # json or text lines on stdout, with per module levels like 'app.event=DEBUG,sqlalchemy.pool=INFO'
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = parse_levels(os.getenv('LOG_LEVELS'))
+    # share of the SQL statements logged, 0 disables statement logging
+    SQL_LOG_SAMPLE_RATE = float(os.getenv('SQL_LOG_SAMPLE_RATE', 0))
+    # requests slower than this are logged with all their statements
+    SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+    PROFILE_SLOWEST_STATEMENTS = 3
+    # bearer token required by /metrics when set
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # connections kept per worker, extra ones opened under load and seconds to wait for one
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DATABASE_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DATABASE_MAX_OVERFLOW', 5)),
+        'pool_timeout': 10,
+        'pool_recycle': 1800,
+        'connect_args': {
+            'options': '-c statement_timeout=%d' % int(os.getenv('DATABASE_STATEMENT_TIMEOUT_MS', 30000))
+        }
+    }
+    # test pooled connections on checkout and reconnect the ones dropped by the server
+    SQLALCHEMY_POOL_PRE_PING = True
+    # read replica used by the idempotent GET views, e.g. postgresql://localhost/sg_replica
+    SQLALCHEMY_REPLICA_URI = os.getenv('DATABASE_REPLICA_URL')
     AUTH_TOKEN_EXPIRY_DAYS = 30
     AUTH_TOKEN_EXPIRY_SECONDS = 3000
+    # login attempts allowed in a burst and seconds to get one back, per email and per client address
+    LOGIN_LIMIT_EMAIL_ATTEMPTS = 5
+    LOGIN_LIMIT_EMAIL_REFILL_SECONDS = 60
+    LOGIN_LIMIT_ADDRESS_ATTEMPTS = 20
+    LOGIN_LIMIT_ADDRESS_REFILL_SECONDS = 6
+    # keep the login buckets in the database to share them between workers
+    LOGIN_LIMIT_SHARED = os.getenv('LOGIN_LIMIT_SHARED') == '1'
+    # a registration only clears the unknown email in the other workers when the entries are shared
+    LOGIN_UNKNOWN_EMAIL_TTL_SECONDS = 60 if LOGIN_LIMIT_SHARED else 5
+    # proxies in front of the app appending to X-Forwarded-For, one for the Heroku router
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 1))
     BUCKET_AND_ITEMS_PER_PAGE = 25
     GROUNDS_PER_PAGE = 25
+    # snap distance sorted ground pages to a grid and share the ground order per grid cell
+    GROUNDS_GRID_SNAP = os.getenv('GROUNDS_GRID_SNAP') == '1'
+    GROUNDS_GRID_SIZE_METERS = 100
+    # leading pages of ground ids cached per grid cell, later pages are queried
+    GROUNDS_GRID_CACHED_PAGES = 5
     EVENTS_PER_PAGE = 25
+    EVENTS_NEARBY_RADIUS_KM = 5
+    EVENTS_NEARBY_MAX_RADIUS_KM = 50
+    # an event starting this many hours later scores like one a whole radius farther
+    EVENTS_NEARBY_HORIZON_HOURS = 24
     TEAMS_PER_PAGE = 25
     MESSAGES_PER_PAGE = 25
+    MESSAGES_MAX_LENGTH = 2000
+    MESSAGES_FLUSH_INTERVAL_MS = 20
+    MESSAGES_FLUSH_BATCH_SIZE = 100
+    MESSAGES_ID_BLOCK_SIZE = 100
+    MESSAGES_CACHE_SIZE = 50
+    MESSAGES_CACHE_TTL_SECONDS = 30
+    MESSAGES_CACHE_EVENTS = 1000
+    MESSAGES_SYNC_SETTLE_MS = 5000
     USERS_PER_PAGE = 25
     UPLOAD_FOLDER = 'app/tmp/files'
+    MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+    # size of the parts of multipart uploads, at least 5 MB for S3, and parts uploaded at once
+    UPLOAD_PART_SIZE = 5 * 1024 * 1024
+    UPLOAD_THREADS = 4
+    AVATAR_THUMBNAIL_SIZES = [64, 256]
+    # point the S3 client to a local S3 compatible server
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+    RESPONSE_CACHE_MAX_ENTRIES = 2000
+    RESPONSE_CACHE_TTL_SECONDS = 300
+    # postgresql:// uses LISTEN/NOTIFY, redis:// and amqp:// use the Redis/Kombu managers
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = 'flask-socketio'
+    # run the periodic jobs in this process, set to 0 for the web workers when a clock process runs them
+    SCHEDULE_PERIODIC_JOBS = os.getenv('SCHEDULE_PERIODIC_JOBS', '1') == '1'
 
 
 class DevelopmentConfig(Config):
@@ -31,6 +101,25 @@ class DevelopmentConfig(Config):
     """
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', postgres_local_base + database_name)
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    SQL_LOG_SAMPLE_RATE = float(os.getenv('SQL_LOG_SAMPLE_RATE', 1))
+    BCRYPT_HASH_PREFIX = 4
+    AUTH_TOKEN_EXPIRY_DAYS = 1
+    AUTH_TOKEN_EXPIRY_SECONDS = 20
+    BUCKET_AND_ITEMS_PER_PAGE = 4
+    GROUNDS_PER_PAGE = 4
+    EVENTS_PER_PAGE = 12
+    TEAMS_PER_PAGE = 4
+    USERS_PER_PAGE = 6
+    MESSAGES_PER_PAGE = 10
+
+
+class TestingConfig(Config):
+    """
+    Testing application configuration
+    """
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_TEST_URL', postgres_local_base + database_name + '_test')
     BCRYPT_HASH_PREFIX = 4
     AUTH_TOKEN_EXPIRY_DAYS = 1
     AUTH_TOKEN_EXPIRY_SECONDS = 20
@@ -46,7 +135,7 @@ class ProductionConfig(Config):
     """
     Production application configuration
     """
-    DEBUG = True
+    DEBUG = False
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', postgres_local_base + database_name)
     BCRYPT_HASH_PREFIX = 13
     AUTH_TOKEN_EXPIRY_DAYS = 30
@@ -0,0 +1,197 @@
+import threading
+from functools import wraps
+from timeit import default_timer
+
+import psycopg2
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from eventlet.hubs import trampoline
+from eventlet.patcher import is_monkey_patched
+from psycopg2 import extensions
+from sqlalchemy import event, exc, orm, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool counting checkouts, the time spent waiting for a connection
+    and the checkouts which timed out because the pool was exhausted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        begin = default_timer()
+        with self.stats_lock:
+            self.waiting += 1
+
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = default_timer() - begin
+            with self.stats_lock:
+                self.waiting -= 1
+                self.checkouts += 1
+                self.wait_seconds += elapsed
+                self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': self.overflow(),
+                'waiting': self.waiting,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds
+            }
+
+
+def ping_connection(connection, branch):
+    """
+    Test connections when they are checked out and replace the ones closed by the server,
+    the pessimistic disconnect handling recipe for SQLAlchemy versions without pool_pre_ping.
+    """
+    if branch:
+        return
+
+    should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+
+    try:
+        connection.scalar(select([1]))
+    except exc.DBAPIError as e:
+        # the connection was invalidated by the failed ping, the retry opens a new one
+        if e.connection_invalidated:
+            connection.scalar(select([1]))
+        else:
+            raise
+    finally:
+        connection.should_close_with_result = should_close_with_result
+
+
+def eventlet_wait_callback(conn, timeout=-1):
+    """
+    psycopg2 wait callback waiting for the connection in the eventlet hub, so queries
+    yield to other greenlets instead of blocking the worker.
+    """
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError('Bad result from poll: %r' % state)
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session reading from the replica bind in views marked with read_replica.
+    Writes, locking reads and every query after the first write of the session
+    go to the primary, so a request always reads its own writes.
+    """
+
+    def __init__(self, db, *args, **kwargs):
+        # SignallingSession only keeps the app of db
+        self.db = db
+        self.wrote = False
+        super(RoutingSession, self).__init__(db, *args, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            self.wrote = True
+        elif not self.wrote and reads_replica(self.app) and \
+                (clause is None or clause._for_update_arg is None):
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy using RoutingSession.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def reads_replica(app):
+    return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {}) and \
+        has_request_context() and g.get('read_replica', False)
+
+
+def read_replica(f):
+    """
+    Decorator routing the reads of an idempotent view to the read replica when one is configured.
+    :param f:
+    :return:
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.read_replica = False
+
+    return decorated_function
+
+
+def read_primary():
+    """
+    Route the following reads of the request to the primary, after writes done outside the session.
+    """
+    if has_request_context():
+        g.read_replica = False
+
+
+def configure_database(app):
+    """
+    Prepare the database driver and engine options before the engine is created.
+    :param app: Flask application
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+                                                   poolclass=TimedQueuePool)
+
+    replica_url = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{REPLICA_BIND: replica_url})
+
+    if app.config.get('SQLALCHEMY_POOL_PRE_PING') and not event.contains(Engine, 'engine_connect', ping_connection):
+        event.listen(Engine, 'engine_connect', ping_connection)
+
+    if is_monkey_patched('socket'):
+        extensions.set_wait_callback(eventlet_wait_callback)
+
+
+def pool_stats(engine):
+    """
+    Usage of the connection pool of the engine.
+    :param engine: Engine
+    :return: Dict of pool counters, empty if the pool does not keep them
+    """
+    pool = engine.pool
+    return pool.stats() if isinstance(pool, TimedQueuePool) else {}
@@ -0,0 +1,217 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from sqlalchemy import exc, text
+from sqlalchemy.orm import joinedload
+from app import app, db, sockets
+from app.database import read_primary
+from app.metrics.helper import chat_messages_stored
+from app.models import EventMessage
+
+logger = logging.getLogger(__name__)
+
+# errors of the connection or the pool, the same rows can be stored once they are gone
+RETRYABLE_ERRORS = (exc.OperationalError, exc.TimeoutError)
+
+
+class MessageBuffer(object):
+    """
+    Write-behind buffer of chat messages.
+    Messages get their id from blocks preallocated on the eventmessages sequence
+    and their create time on append, so they can be broadcast right away. A background
+    task then stores them with multi-row inserts every flush interval, or as soon as
+    the batch size is reached. Pending messages are flushed on interpreter exit, so
+    only a killed worker can lose the last flush interval of messages.
+    Batches failing on connection errors are retried on the next flush, batches failing
+    on a bad row are stored row by row, dropping the rows the database rejects.
+    """
+
+    def __init__(self, flush_interval, batch_size, id_block_size):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.id_block_size = id_block_size
+
+        self.lock = threading.Lock()
+        self.ids_lock = threading.Lock()
+        self.pending = []
+        self.ids = []
+        self.flusher = None
+
+    def append(self, message):
+        """
+        Assign an id to the message and queue it for storing.
+        :param message: Transient EventMessage
+        :return: EventMessage
+        """
+        message.id = self._next_id()
+
+        with self.lock:
+            self.pending.append({
+                'id': message.id,
+                'event_id': message.event_id,
+                'sender_id': message.sender_id,
+                'text': message.text,
+                'create_at': message.create_at
+            })
+            pending_count = len(self.pending)
+
+            if self.flusher is None:
+                self.flusher = sockets.start_background_task(self._run)
+
+        if pending_count >= self.batch_size:
+            self.flush()
+
+        return message
+
+    def flush(self):
+        """
+        Store all pending messages in one multi-row insert.
+        :return: Count of stored messages
+        """
+        with self.lock:
+            rows, self.pending = self.pending, []
+
+        if not rows:
+            return 0
+
+        try:
+            self._insert(rows)
+        except RETRYABLE_ERRORS:
+            logger.exception('Failed to store %d chat messages, retrying on next flush', len(rows))
+            self._requeue(rows)
+            return 0
+        except exc.StatementError:
+            logger.exception('Failed to store %d chat messages at once, storing them one by one', len(rows))
+            return self._flush_rows(rows)
+
+        chat_messages_stored.inc(len(rows))
+        return len(rows)
+
+    def _flush_rows(self, rows):
+        stored = 0
+        for i, row in enumerate(rows):
+            try:
+                self._insert([row])
+            except RETRYABLE_ERRORS:
+                logger.exception('Failed to store %d chat messages, retrying on next flush', len(rows) - i)
+                self._requeue(rows[i:])
+                break
+            except exc.StatementError:
+                logger.exception('Dropped chat message %d of event %s', row['id'], row['event_id'])
+            else:
+                stored += 1
+
+        chat_messages_stored.inc(stored)
+        return stored
+
+    def _insert(self, rows):
+        with db.engine.begin() as connection:
+            connection.execute(EventMessage.__table__.insert().values(rows))
+
+    def _requeue(self, rows):
+        with self.lock:
+            self.pending = rows + self.pending
+
+    def _next_id(self):
+        with self.ids_lock:
+            if not self.ids:
+                with db.engine.connect() as connection:
+                    result = connection.execute(
+                        text("SELECT nextval('eventmessages_id_seq') FROM generate_series(1, :count)"),
+                        count=self.id_block_size
+                    )
+                    self.ids = list(map(lambda r: r[0], result))
+                self.ids.reverse()
+            return self.ids.pop()
+
+    def _run(self):
+        while True:
+            sockets.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush chat messages')
+
+
+class RecentMessages(object):
+    """
+    Ring buffer of the last serialized messages of each active event, newest first.
+    It is populated on write and seeded from the database on the first read of an event.
+    Messages written through other workers only show up after the entry expires,
+    so entries are reseeded once they are older than the ttl.
+    """
+
+    def __init__(self, size, ttl, max_events):
+        self.size = size
+        self.ttl = ttl
+        self.max_events = max_events
+
+        self.lock = threading.Lock()
+        self.events = OrderedDict()
+
+    def append(self, event_id, message_json):
+        """
+        Add a new message to the event ring buffer if the event is cached.
+        :param event_id: Event Id
+        :param message_json: Serialized message
+        """
+        with self.lock:
+            entry = self.events.get(event_id)
+            if entry is None:
+                return
+
+            messages, complete, loaded_at = entry
+            if complete and len(messages) == self.size:
+                complete = False
+            messages.appendleft(message_json)
+            self.events[event_id] = (messages, complete, loaded_at)
+
+    def get(self, event_id):
+        """
+        Return the recent messages of the event, newest first.
+        :param event_id: Event Id
+        :return: List of serialized messages and whether it holds the whole event history
+        """
+        with self.lock:
+            entry = self.events.get(event_id)
+            if entry is not None and time.time() - entry[2] < self.ttl:
+                self.events.move_to_end(event_id)
+                return list(entry[0]), entry[1]
+
+        # pending messages of this worker have to be in the seed
+        if message_buffer.flush():
+            read_primary()
+
+        seed = EventMessage.query.options(joinedload(EventMessage.sender)) \
+            .filter(EventMessage.event_id == event_id) \
+            .order_by(EventMessage.create_at.desc(), EventMessage.id.desc()) \
+            .limit(self.size) \
+            .all()
+
+        messages = deque(map(lambda m: m.json(), seed), maxlen=self.size)
+        complete = len(seed) < self.size
+
+        with self.lock:
+            self.events[event_id] = (messages, complete, time.time())
+            self.events.move_to_end(event_id)
+            while len(self.events) > self.max_events:
+                self.events.popitem(last=False)
+
+        return list(messages), complete
+
+
+message_buffer = MessageBuffer(
+    app.config['MESSAGES_FLUSH_INTERVAL_MS'] / 1000.0,
+    app.config['MESSAGES_FLUSH_BATCH_SIZE'],
+    app.config['MESSAGES_ID_BLOCK_SIZE']
+)
+
+recent_messages = RecentMessages(
+    app.config['MESSAGES_CACHE_SIZE'],
+    app.config['MESSAGES_CACHE_TTL_SECONDS'],
+    app.config['MESSAGES_CACHE_EVENTS']
+)
+
+atexit.register(message_buffer.flush)
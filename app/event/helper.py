@@ -1,11 +1,19 @@
 import os
+import math
 import requests
-from datetime import datetime, date
-from flask import make_response, jsonify, url_for
+from datetime import datetime, date, timedelta, timezone
+from dateutil.parser import isoparse
+from flask import make_response, jsonify, url_for, session
 from flask_sqlalchemy import BaseQuery
-from sqlalchemy import orm, func, and_, or_, case
+from sqlalchemy import orm, func, and_, or_, case, tuple_, cast, Numeric
 from app import app, db
-from app.models import Event, EventStatus, EventType, TrainingEvent, MatchEvent, TourneyEvent, Ground, User, Team, Activity
+from app.models import Event, EventStatus, EventType, TrainingEvent, MatchEvent, TourneyEvent, Ground, User, Team, Activity, \
+    EventMessage
+from app.event.buffer import recent_messages
+
+KILOMETERS_PER_LATITUDE_DEGREE = 111.045
+# nearby scores are exact numerics with this many decimal digits
+NEARBY_SCORE_DIGITS = 9
 
 def response(status, message, code):
     return make_response(jsonify({
@@ -31,23 +39,61 @@ def response_for_created_message(message, status_code):
         'message': message.json()
     })), status_code
 
+def message_text_error(text):
+    """
+    Check the text of a new chat message before it is broadcast and buffered for storing.
+    :param text: Message text
+    :return: Error message, or None if the text can be stored
+    """
+    if '\x00' in text:
+        return 'Message must not contain NUL characters'
+    if len(text) > app.config['MESSAGES_MAX_LENGTH']:
+        return 'Message must not be longer than %d characters' % app.config['MESSAGES_MAX_LENGTH']
+    return None
+
 def get_event_json_list(events):
     json_list = []
     for event in events:
         json_list.append(event.short_json())
     return json_list
 
-def get_message_json_list(messages):
+def get_message_json_list(messages, user=None):
+    rated_user_ids = None
+    if user:
+        rated_user_ids = User.rated_user_ids(user, map(lambda m: m.sender_id, messages))
+
     json_list = []
     for message in messages:
-        json_list.append(message.json())
+        json_list.append(message.json(user, rated_user_ids))
     return json_list
 
-def extract_parameters_from_socket_event_data(data):
-    token = data.get('token')
-        
+def get_cached_message_json_list(messages, user=None):
+    """
+    Copy serialized messages from the recent messages cache adding the viewer's 'rated'
+    attribute to their senders.
+    :param messages: Serialized messages
+    :param user: Viewing User
+    :return:
+    """
+    if not user:
+        return messages
+
+    rated_user_ids = User.rated_user_ids(user, map(lambda m: m['sender']['id'], messages))
+
+    json_list = []
+    for message in messages:
+        sender = dict(message['sender'], rated=message['sender']['id'] in rated_user_ids)
+        json_list.append(dict(message, sender=sender))
+    return json_list
+
+def authenticate_socket_token(token):
+    """
+    Resolve the user of a socket auth token.
+    :param token: Auth Token
+    :return: User and error message
+    """
     if not token:
-        return None, None, 'Token is missing'
+        return None, 'Token is missing'
 
     decode_response = None
     try:
@@ -57,21 +103,74 @@ def extract_parameters_from_socket_event_data(data):
         message = 'Invalid token'
         if isinstance(decode_response, str):
             message = decode_response
-        return None, None, message
+        return None, message
+
+    if not current_user:
+        return None, 'Invalid token'
+
+    return current_user, None
+
+def extract_parameters_from_socket_event_data(data):
+    current_user, error = authenticate_socket_token(data.get('token'))
+
+    if error:
+        return None, None, error
+
+    event, error = extract_event_from_socket_event_data(data)
 
+    if error:
+        return None, None, error
+
+    return current_user, event, None
+
+def extract_event_from_socket_event_data(data):
     event_id = data.get('eventId')
 
     try:
         int(event_id)
-    except ValueError:
-        return None, None, 'Invalid Event Id'
+    except (TypeError, ValueError):
+        return None, 'Invalid Event Id'
 
     event = Event.get_by_id(event_id)
 
     if not event:
-        return None, None, 'Event cannot be found'
+        return None, 'Event cannot be found'
+
+    return event, None
+
+def store_socket_session_user(user):
+    """
+    Keep the authenticated chat user in the socket session, so following chat
+    events of the connection are served without decoding the token again.
+    :param user: User
+    :return: User json
+    """
+    user_json = user.json()
+    session['chat_user_id'] = user.id
+    session['chat_user'] = user_json
+    return user_json
+
+def extract_joined_parameters_from_socket_session(data):
+    """
+    Resolve the chat user and event of a chat event from the socket session without
+    any query. The user id is None when the connection isn't authenticated or the event
+    wasn't joined, the caller then falls back to the token of the event data.
+    :param data: Socket event data
+    :return: User id, user json, event id and error message
+    """
+    user_id = session.get('chat_user_id')
+    if not user_id:
+        return None, None, None, None
 
-    return current_user, event, None
+    try:
+        event_id = int(data.get('eventId'))
+    except (TypeError, ValueError):
+        return None, None, None, 'Invalid Event Id'
+
+    if not event_id in session.get('chat_event_ids', []):
+        return None, None, None, None
+
+    return user_id, session['chat_user'], event_id, None
 
 def response_with_pagination_events(events, previous, nex, count):
     return make_response(jsonify({
@@ -92,6 +191,23 @@ def response_with_pagination_messages(messages, previous, nex, skip, count):
         'messages': messages
     })), 200
 
+def response_with_messages_since(messages, high_water_mark, nex):
+    return make_response(jsonify({
+        'status': 'success',
+        'next': nex,
+        'count': len(messages),
+        'highWaterMark': high_water_mark,
+        'messages': messages
+    })), 200
+
+def response_with_nearby_events(events, nex):
+    return make_response(jsonify({
+        'status': 'success',
+        'next': nex,
+        'count': len(events),
+        'events': events
+    })), 200
+
 def paginate_events(page, ground_id, status_value, type_value, activity_value, owner_id, participant_id):
     ground = Ground.get_by_id(ground_id) if ground_id else None
     status = EventStatus(status_value) if status_value else None
@@ -145,20 +261,174 @@ def paginate_events(page, ground_id, status_value, type_value, activity_value, o
 
     return items, nex, pagination, previous
 
-def paginate_messages(skip, count, event, user_id):
+def paginate_messages(skip, count, before_id, event, user):
+    """
+    Page through the event messages, newest first.
+    The first page is served from the recent messages ring buffer, older pages are
+    read with a keyset query on (event_id, create_at, id) after the before message.
+    Skipping by offset is still supported for older clients.
+    :return: Messages json, next page url, previous page url, skip and messages count
+    """
     limit = count
     if not limit:
         limit = app.config['MESSAGES_PER_PAGE']
 
-    messages = event.messages.offset(skip).limit(limit).all()
-    total_count = event.messages.count()
+    if before_id:
+        messages = get_messages_before(event, before_id, limit + 1)
+        has_next = len(messages) > limit
+        json_list = get_message_json_list(messages[:limit], user)
+    elif skip == 0 and limit <= recent_messages.size:
+        cached_messages, complete = recent_messages.get(event.id)
+        has_next = len(cached_messages) > limit or not complete
+        json_list = get_cached_message_json_list(cached_messages[:limit], user)
+    else:
+        messages = event.messages.options(orm.joinedload(EventMessage.sender)).offset(skip).limit(limit + 1).all()
+        has_next = len(messages) > limit
+        json_list = get_message_json_list(messages[:limit], user)
 
     previous = None
     if skip > 0:
         previous = url_for('event.get_event_messages', event_id=event.id, count=skip, skip=0, _external=True)
 
     nex = None
-    if len(messages) + skip < total_count:
-        nex = url_for('event.get_event_messages', event_id=event.id, count=limit, skip=skip + len(messages), _external=True)
+    if has_next and json_list:
+        nex = url_for('event.get_event_messages', event_id=event.id, count=limit, before=json_list[-1]['id'], _external=True)
             
-    return messages, nex, previous, skip, len(messages)
+    return json_list, nex, previous, skip, len(json_list)
+
+def get_messages_before(event, before_id, limit):
+    """
+    Keyset query of the event messages older than the given message.
+    :param event: Event
+    :param before_id: Id of the last message already received
+    :param limit: Messages count
+    :return:
+    """
+    before = db.session.query(EventMessage.create_at).filter_by(id=before_id, event_id=event.id).first()
+    if not before:
+        return []
+
+    return EventMessage.query.options(orm.joinedload(EventMessage.sender)) \
+        .filter(EventMessage.event_id == event.id) \
+        .filter(tuple_(EventMessage.create_at, EventMessage.id) < tuple_(before.create_at, before_id)) \
+        .order_by(EventMessage.create_at.desc(), EventMessage.id.desc()) \
+        .limit(limit) \
+        .all()
+
+def sync_messages(since, count, event, user):
+    """
+    Return the event messages newer than the since cursor in ascending order.
+    The cursor is a message id or an iso timestamp. Message ids are preallocated in
+    blocks by every worker, so they don't follow the commit order and the cursor is
+    resolved to (create_at, id) instead, served by the (event_id, create_at, id) index.
+    The high water mark only moves past messages older than the settle window, messages
+    still being flushed by other workers are sent again on the next sync. The next page
+    starts from the high water mark, so it is given only when the whole page has settled.
+    :return: Messages json, high water mark and next page url
+    :raises ValueError: If the cursor is malformed or the since message cannot be found
+    """
+    limit = count
+    if not limit:
+        limit = app.config['MESSAGES_PER_PAGE']
+
+    messages_query = EventMessage.query.options(orm.joinedload(EventMessage.sender)) \
+        .filter(EventMessage.event_id == event.id)
+
+    try:
+        since_id = int(since)
+    except ValueError:
+        try:
+            since_at = isoparse(since)
+        except ValueError:
+            raise ValueError('Wrong since attribute, message id or iso datetime expected')
+        if since_at.tzinfo:
+            since_at = since_at.astimezone(timezone.utc).replace(tzinfo=None)
+        messages_query = messages_query.filter(EventMessage.create_at > since_at)
+    else:
+        cursor = db.session.query(EventMessage.create_at).filter_by(id=since_id, event_id=event.id).first()
+        if not cursor:
+            raise ValueError('Message with since id cannot be found in the event')
+        messages_query = messages_query \
+            .filter(tuple_(EventMessage.create_at, EventMessage.id) > tuple_(cursor.create_at, since_id))
+
+    messages = messages_query \
+        .order_by(EventMessage.create_at, EventMessage.id) \
+        .limit(limit + 1) \
+        .all()
+
+    has_next = len(messages) > limit
+    messages = messages[:limit]
+
+    settled_at = datetime.utcnow() - timedelta(milliseconds=app.config['MESSAGES_SYNC_SETTLE_MS'])
+    high_water_mark = since
+    for message in messages:
+        if message.create_at > settled_at:
+            break
+        high_water_mark = str(message.id)
+
+    nex = None
+    if has_next and high_water_mark == str(messages[-1].id):
+        nex = url_for('event.get_event_messages', event_id=event.id, count=limit, since=high_water_mark, _external=True)
+
+    return get_message_json_list(messages, user), high_water_mark, nex
+
+def paginate_nearby_events(latitude, longitude, radius, activity_value, at, after_score, after_id):
+    """
+    Scheduled events on grounds within the radius, ordered by a score mixing the distance
+    and the time left before the event begins. Grounds are prefiltered by a bounding box
+    of the radius before the exact distance is computed. Pages are chained with a keyset
+    cursor on (score, id), scores are computed against the time of the first page and
+    rounded to a numeric in SQL, so the cursor compares equal to the score it came from.
+    :param latitude: Latitude of the user
+    :param longitude: Longitude of the user
+    :param radius: Radius in kilometers
+    :param activity_value: Activity filter
+    :param at: Reference time of the first page
+    :param after_score: Score of the last event of the previous page, as a Decimal
+    :param after_id: Id of the last event of the previous page
+    :return: Events json and next page url
+    """
+    activity = Activity(activity_value) if activity_value else None
+    reference = at if at else datetime.utcnow().replace(microsecond=0)
+
+    latitude_delta = radius / KILOMETERS_PER_LATITUDE_DEGREE
+    longitude_delta = radius / (KILOMETERS_PER_LATITUDE_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+
+    distance = Ground.distance_to(latitude, longitude)
+    hours = func.extract('epoch', Event.begin_at - reference) / 3600.0
+    score = func.round(cast(distance / radius + hours / app.config['EVENTS_NEARBY_HORIZON_HOURS'], Numeric),
+                       NEARBY_SCORE_DIGITS)
+
+    events_query = db.session.query(Event, distance.label('distance'), score.label('score')) \
+        .join(Ground, Event.ground_id == Ground.id) \
+        .filter(Ground.latitude.between(latitude - latitude_delta, latitude + latitude_delta)) \
+        .filter(Ground.longitude.between(longitude - longitude_delta, longitude + longitude_delta)) \
+        .filter(distance <= radius) \
+        .filter(Event.canceled == False) \
+        .filter(Event.begin_at > reference)
+
+    if activity:
+        events_query = events_query.filter(Event.activity == activity)
+
+    if after_score is not None and after_id is not None:
+        events_query = events_query.filter(or_(score > after_score, and_(score == after_score, Event.id > after_id)))
+
+    per_page = app.config['EVENTS_PER_PAGE']
+    rows = events_query.order_by(score, Event.id).limit(per_page + 1).all()
+
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    json_list = []
+    for event, event_distance, event_score in rows:
+        json = event.short_json()
+        json['distance'] = event_distance
+        json_list.append(json)
+
+    nex = None
+    if has_next:
+        last_event, last_distance, last_score = rows[-1]
+        nex = url_for('event.nearby_events', latitude=latitude, longitude=longitude, radius=radius, activity=activity_value,
+                      at=reference.isoformat(), afterScore=last_score, afterId=last_event.id, _external=True)
+
+    return json_list, nex
@@ -1,12 +1,19 @@
 import json
+from datetime import timezone
+from decimal import Decimal, InvalidOperation
 from dateutil.parser import isoparse
-from flask import Blueprint, request, abort
+from flask import Blueprint, request, abort, session
 from flask_socketio import send, emit, join_room, leave_room
-from app import sockets
+from app import app, sockets
 from app.auth.helper import token_required
+from app.database import read_replica, read_primary
+from app.conditional import conditional
+from app.event.buffer import message_buffer, recent_messages
+from app.metrics.helper import chat_messages
 from app.event.helper import response, response_for_event, response_for_created_event, response_for_created_message, \
-    response_with_pagination_events, response_with_pagination_messages, get_event_json_list, get_message_json_list, \
-    paginate_events, paginate_messages, extract_parameters_from_socket_event_data
+    response_with_pagination_events, response_with_pagination_messages, get_event_json_list, \
+    response_with_messages_since, response_with_nearby_events, paginate_events, paginate_nearby_events, paginate_messages, sync_messages, authenticate_socket_token, extract_parameters_from_socket_event_data, \
+    extract_event_from_socket_event_data, extract_joined_parameters_from_socket_session, store_socket_session_user, message_text_error
 from app.models import User, Ground, Activity, Event, TrainingEvent, MatchEvent, TourneyEvent, EventType, EventStatus, \
     EventParticipantsLevel, Team, EventMessage
 
@@ -14,6 +21,7 @@ from app.models import User, Ground, Activity, Event, TrainingEvent, MatchEvent,
 event = Blueprint('event', __name__)
 
 @event.route('/events', methods=['GET'])
+@read_replica
 @token_required
 def events(current_user):
     page = request.args.get('page', 1, type=int)
@@ -32,6 +40,52 @@ def events(current_user):
     return response_with_pagination_events([], previous, nex, 0)
 
 
+@event.route('/events/nearby', methods=['GET'])
+@read_replica
+@token_required
+def nearby_events(current_user):
+    latitude = request.args.get('latitude', None, type=float)
+    longitude = request.args.get('longitude', None, type=float)
+    radius = request.args.get('radius', app.config['EVENTS_NEARBY_RADIUS_KM'], type=float)
+    activity = request.args.get('activity', None, type=int)
+    at = request.args.get('at', None)
+    after_score = request.args.get('afterScore', None)
+    after_id = request.args.get('afterId', None, type=int)
+
+    if latitude is None or longitude is None:
+        return response('failed', 'Missing latitude or longitude attribute', 400)
+
+    if not 0 < radius <= app.config['EVENTS_NEARBY_MAX_RADIUS_KM']:
+        return response('failed', 'Wrong radius attribute value', 400)
+
+    if activity:
+        try:
+            Activity(activity)
+        except ValueError:
+            return response('failed', "Activity not found", 404)
+
+    if after_score is not None:
+        try:
+            after_score = Decimal(after_score)
+        except InvalidOperation:
+            return response('failed', 'Wrong afterScore attribute type', 400)
+
+        if not after_score.is_finite():
+            return response('failed', 'Wrong afterScore attribute type', 400)
+
+    if at:
+        try:
+            at = isoparse(at)
+        except ValueError:
+            return response('failed', 'Wrong at attribute type', 400)
+
+        if at.tzinfo:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+
+    items, nex = paginate_nearby_events(latitude, longitude, radius, activity, at, after_score, after_id)
+    return response_with_nearby_events(items, nex)
+
+
 @event.route('/events', methods=['POST'])
 @token_required
 def create_event(current_user):
@@ -187,6 +241,7 @@ def create_event(current_user):
 
 @event.route('/events/<event_id>', methods=['GET'])
 @token_required
+@conditional(Event.get_modified_at, per_user=True)
 def get_event(current_user, event_id):
     try:
         int(event_id)
@@ -195,7 +250,7 @@ def get_event(current_user, event_id):
     else:
         event = Event.get_by_id(event_id)
         if event:
-            return response_for_event(event.json(current_user))
+            return response_for_event(event.json(current_user, request.args.get('fields') == 'summary'))
         return response('failed', "Event not found", 404)
 
 
@@ -310,20 +365,11 @@ def join_to_event(current_user, event_id):
     if not (event.participants_age_from <= user.age <= event.participants_age_to):
         return response('failed', 'User\'s age does\'t meet the requirements of the event', 400)
 
-    if user in team.participants:
-        return response('failed', 'User already joined to the team', 400)
-
-    if team.is_full:
-        return response('failed', 'Team is full', 400)
-
-    # remove user from other team in event
-    for t in event.teams:
-        if user in t.participants:
-            t.participants.remove(user)
-
-    # add user to team
-    team.participants.append(user)
-    team.update()
+    # move user to the team under the event teams lock
+    try:
+        event.join(user, team)
+    except ValueError as error:
+        return response('failed', str(error), 400)
 
     return response_for_created_event(event.json(current_user), 201)
 
@@ -351,26 +397,22 @@ def leave_from_event(current_user, event_id):
         event.cancel()
         return response_for_created_event(event.json(user), 201)
 
-    team = None
-
-    for t in event.teams:
-        if user in t.participants:
-            team = t
-    
-    if not team:
-        return response('failed', 'Team to leave cannot be found', 404)
-
-    team.participants.remove(user)
-    team.update()
+    try:
+        event.leave(user)
+    except ValueError as error:
+        return response('failed', str(error), 404)
 
     return response_for_created_event(event.json(user), 201)
 
 
 @event.route('/events/<event_id>/messages', methods=['GET'])
+@read_replica
 @token_required
 def get_event_messages(current_user, event_id):
     skip = request.args.get('skip', 0, type=int)
     count = request.args.get('count', None, type=int)
+    before = request.args.get('before', None, type=int)
+    since = request.args.get('since', None)
 
     try:
         int(event_id)
@@ -382,8 +424,19 @@ def get_event_messages(current_user, event_id):
     if not event:
         abort(404)
 
-    messages, nex, previous, skip, total = paginate_messages(skip, count, event, user)
-    return response_with_pagination_messages(get_message_json_list(messages), previous, nex, skip, total)
+    # make messages sent through this worker's socket visible to the history
+    if message_buffer.flush():
+        read_primary()
+
+    if since:
+        try:
+            messages, high_water_mark, nex = sync_messages(since, count, event, user)
+        except ValueError as error:
+            return response('failed', str(error), 400)
+        return response_with_messages_since(messages, high_water_mark, nex)
+
+    messages, nex, previous, skip, total = paginate_messages(skip, count, before, event, user)
+    return response_with_pagination_messages(messages, previous, nex, skip, total)
 
 
 @event.route('/events/<event_id>/messages', methods=['POST'])
@@ -408,19 +461,42 @@ def create_event_message(current_user, event_id):
             return response('failed', 'Missing text attribute', 400)
 
         try:
-            str(text)
+            text = str(text)
         except ValueError:
             return response('failed', "Wrong text attribute type", 400)
 
+        error = message_text_error(text)
+        if error:
+            return response('failed', error, 400)
+
         message = EventMessage(user, text)
         event.messages.append(message)
         event.update()
 
+        recent_messages.append(event.id, message.json())
+        chat_messages.inc(transport='rest')
+
         return response_for_created_message(message, 201)
     return response('failed', 'Content-type must be json', 202)
 
 # Event chat
 
+@sockets.on('connect', namespace='/event/messages')
+def on_connect_event_chat():
+    """Sent by clients when they connect to the chat namespace.
+    A token passed in the connection query string authenticates the whole
+    connection, so chat events don't need to carry and verify it again."""
+    session['chat_event_ids'] = []
+
+    token = request.args.get('token')
+    if token:
+        user, error = authenticate_socket_token(token)
+        if error:
+            return False
+
+        store_socket_session_user(user)
+
+
 @sockets.on('join', namespace='/event/messages')
 def on_join_event_chat(data):
     """Sent by clients when they enter a room.
@@ -428,7 +504,13 @@ def on_join_event_chat(data):
     if isinstance(data, str):
         data = json.loads(data)
 
-    user, event, error = extract_parameters_from_socket_event_data(data)
+    if session.get('chat_user_id'):
+        user_json = session['chat_user']
+        event, error = extract_event_from_socket_event_data(data)
+    else:
+        user, event, error = extract_parameters_from_socket_event_data(data)
+        if not error:
+            user_json = store_socket_session_user(user)
 
     if error:
         emit('status', {
@@ -438,11 +520,23 @@ def on_join_event_chat(data):
     else:
         join_room(event.id)
 
+        event_ids = session.get('chat_event_ids', [])
+        if not event.id in event_ids:
+            session['chat_event_ids'] = event_ids + [event.id]
+
         emit('joined', {
             'status': 'success',
-            'user': user.json()
+            'user': user_json
         }, room=event.id)
 
+        # backfill the joining client from the recent messages ring buffer, the client is
+        # connected to this process so the page skips the message queue and its size limit
+        messages, complete = recent_messages.get(event.id)
+        emit('history', {
+            'status': 'success',
+            'messages': messages[:app.config['MESSAGES_PER_PAGE']]
+        }, room=request.sid, ignore_queue=True)
+
 
 @sockets.on('message', namespace='/event/messages')
 def message(data):
@@ -451,7 +545,12 @@ def message(data):
     if isinstance(data, str):
         data = json.loads(data)
 
-    user, event, error = extract_parameters_from_socket_event_data(data)
+    user_id, user_json, event_id, error = extract_joined_parameters_from_socket_session(data)
+
+    if not user_id and not error:
+        user, event, error = extract_parameters_from_socket_event_data(data)
+        if not error:
+            user_id, user_json, event_id = user.id, user.json(), event.id
 
     if error:
         emit('status', {
@@ -460,21 +559,23 @@ def message(data):
         }, room=request.sid)
     else:
         message = data.get('message')
-    
-        if message and isinstance(message, str):
-            event_message = EventMessage(user, message)
-            event.messages.append(event_message)
-            event.update()
+        error = message_text_error(message) if message and isinstance(message, str) else 'Wrong type of Message attribute'
+
+        if not error:
+            event_message = message_buffer.append(EventMessage(user_id, message, event_id))
+            event_message_json = event_message.json_with_sender(user_json)
+            recent_messages.append(event_id, event_message_json)
+            chat_messages.inc(transport='socket')
 
             emit('message', {
                 'status': 'success',
-                'newMessage': event_message.json()
-            }, room=event.id)
+                'newMessage': event_message_json
+            }, room=event_id)
         else:
             emit('message', {
                 'status': 'failed',
-                'message': 'Wrong type of Message attribute'
-            }, room=event.id)
+                'message': error
+            }, room=request.sid)
 
 
 @sockets.on('leave', namespace='/event/messages')
@@ -484,7 +585,12 @@ def on_leave_event_chat(data):
     if isinstance(data, str):
         data = json.loads(data)
 
-    user, event, error = extract_parameters_from_socket_event_data(data)
+    user_id, user_json, event_id, error = extract_joined_parameters_from_socket_session(data)
+
+    if not user_id and not error:
+        user, event, error = extract_parameters_from_socket_event_data(data)
+        if not error:
+            user_json, event_id = user.json(), event.id
 
     if error:
         emit('status', {
@@ -492,12 +598,14 @@ def on_leave_event_chat(data):
             'message': error
         }, room=request.sid)
     else:
-        leave_room(event.id)
+        leave_room(event_id)
+
+        session['chat_event_ids'] = [i for i in session.get('chat_event_ids', []) if i != event_id]
 
         emit('leaved', {
             'status': 'success',
-            'user': user.json()
-        }, room=event.id)
+            'user': user_json
+        }, room=event_id)
 
 
 @event.errorhandler(404)
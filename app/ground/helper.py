@@ -1,15 +1,24 @@
 import os
+import math
+import logging
 import requests
 from datetime import datetime, date
+from timeit import default_timer
 from flask import make_response, jsonify, url_for
-from flask_sqlalchemy import BaseQuery
+from flask_sqlalchemy import BaseQuery, Pagination
+from sqlalchemy import func
 from app import app, app_sheduler, db
 from app.models import Activity, Ground, GroundActivity
 from app.ground.models import SourceGround
 from app.ground.config import SourceConfig
+from app.cache import response_cache, DATASET_SCOPE
+from app.metrics.helper import grounds_dataset_updates, grounds_dataset_update_duration, grounds_dataset_update_rows
 
 UPDATE_GROUNDS_DATASET_TIME_DAYS = 1
 UPDATE_GROUNDS_DATASET_JOB_ID = 'app.ground.helper.update_grounds_dataset'
+METERS_PER_LATITUDE_DEGREE = 111045.0
+
+logger = logging.getLogger(__name__)
 
 
 def response(status, message, code):
@@ -104,7 +113,9 @@ def paginate_grounds(user_id, page, latitude, longitude, user):
     :return: Pagination next url, previous url and the user buckets.
     """
 
-    if latitude and longitude:
+    if latitude and longitude and app.config['GROUNDS_GRID_SNAP']:
+        pagination = paginate_grounds_by_grid_cell(page, latitude, longitude)
+    elif latitude and longitude:
         grounds_distance_query = db.session.query(Ground, Ground.distance_to(latitude, longitude).label('distance')).order_by('distance')
         pagination = BaseQuery(grounds_distance_query.subquery(), db.session()) \
             .paginate(page=page, per_page=app.config['GROUNDS_PER_PAGE'], error_out=False)
@@ -133,19 +144,78 @@ def paginate_grounds(user_id, page, latitude, longitude, user):
         ground.distance = result.distance
         return ground
 
-    if latitude and longitude:
+    if latitude and longitude and not app.config['GROUNDS_GRID_SNAP']:
         items = list(map(distance_result_to_ground, items))
 
     return items, nex, pagination, previous
 
 
+def grid_cell(latitude, longitude, size):
+    """
+    Snap a point to the grid of cells with sides of the given size.
+    :param size: Cell side in meters
+    :return: Cell indexes and the cell center point
+    """
+    latitude_step = size / METERS_PER_LATITUDE_DEGREE
+    row = math.floor(latitude / latitude_step)
+    center_latitude = (row + 0.5) * latitude_step
+
+    longitude_step = size / (METERS_PER_LATITUDE_DEGREE * max(math.cos(math.radians(center_latitude)), 0.01))
+    column = math.floor(longitude / longitude_step)
+    center_longitude = (column + 0.5) * longitude_step
+
+    return (row, column), center_latitude, center_longitude
+
+
+def paginate_grounds_by_grid_cell(page, latitude, longitude):
+    """
+    Paginate grounds in the order of distance to the center of the grid cell of the point.
+    The ids of the first pages and the ground count are cached per cell, so users of the
+    same block share one distance sort, and exact distances to the point are computed
+    for the page only. Pages past the cached ones are sorted on every request.
+    :return: Pagination of grounds
+    """
+    size = app.config['GROUNDS_GRID_SIZE_METERS']
+    per_page = app.config['GROUNDS_PER_PAGE']
+    cached_count = app.config['GROUNDS_GRID_CACHED_PAGES'] * per_page
+    cell, center_latitude, center_longitude = grid_cell(latitude, longitude, size)
+
+    ordered_ids = db.session.query(Ground.id) \
+        .order_by(Ground.distance_to(center_latitude, center_longitude), Ground.id)
+
+    def first_ground_ids():
+        ids = list(map(lambda r: r[0], ordered_ids.limit(cached_count).all()))
+        total = len(ids) if len(ids) < cached_count else db.session.query(func.count(Ground.id)).scalar()
+        return ids, total
+
+    key = ('grounds.grid', size, cell, response_cache.generation(DATASET_SCOPE))
+    ground_ids, total = response_cache.get_or_set(key, first_ground_ids)
+
+    if page * per_page <= cached_count:
+        page_ids = ground_ids[(page - 1) * per_page:page * per_page]
+    else:
+        page_ids = list(map(lambda r: r[0], ordered_ids.offset((page - 1) * per_page).limit(per_page).all()))
+
+    grounds_by_id = {}
+    if page_ids:
+        for ground in Ground.query.filter(Ground.id.in_(page_ids)).all():
+            ground.distance = ground.distance_to(latitude, longitude)
+            grounds_by_id[ground.id] = ground
+
+    items = [grounds_by_id[i] for i in page_ids if i in grounds_by_id]
+    return Pagination(None, page, per_page, total, items)
+
+
 def begin_sheduled_updating_grounds_dataset(state):
-    print('app.ground.helper.begin_sheduled_updating_grounds_dataset')
+    if not app.config['SCHEDULE_PERIODIC_JOBS']:
+        return
+    logger.info('Scheduling grounds dataset updates every %d days', UPDATE_GROUNDS_DATASET_TIME_DAYS)
     app_sheduler.add_job(func=update_grounds_dataset, trigger='interval', days=UPDATE_GROUNDS_DATASET_TIME_DAYS, id=UPDATE_GROUNDS_DATASET_JOB_ID, coalesce=True, replace_existing=True)
 
 
 def update_grounds_dataset():
-    print('app.ground.helper.update_grounds_dataset')
+    logger.info('Updating grounds dataset')
+    begin = default_timer()
     source_config = SourceConfig()
 
     base_url = source_config.GROUNDS_SOURCE_BASE_URL
@@ -179,10 +249,9 @@ def update_grounds_dataset():
 
             sources.extend(dataset_rows)
 
-            print('dataset loaded -', k)
-            print('count -', len(dataset_rows))
+            logger.info('Grounds dataset %s loaded', k, extra={'dataset': k, 'rows': len(dataset_rows)})
 
-        print('source loaded')
+        logger.info('Grounds source loaded', extra={'rows': len(sources)})
 
         #Update local database
         for g in sources:
@@ -203,15 +272,24 @@ def update_grounds_dataset():
                 
                 persistent_ground.activities.intersection_update(g.activities)
                 persistent_ground.activities.update(g.activities)
+
+                if db.session.is_modified(persistent_ground):
+                    persistent_ground.modified_at = datetime.utcnow()
             else:
                 ground = Ground(g.id, g.name, g.district, g.address, g.website, g.hasMusic, g.hasWifi, g.hasToilet, g.hasEatery, g.hasDressingRoom, g.hasLighting, g.paid, g.latitude, g.longitude)
                 ground.activities = set(g.activities)
                 db.session.add(ground)
         
         db.session.commit()
-
-    except ValueError as error:
-        print(error)
+        response_cache.bump(DATASET_SCOPE)
+
+        grounds_dataset_updates.inc(status='success')
+        grounds_dataset_update_rows.set(len(sources))
+    except ValueError:
+        logger.exception('Grounds dataset update failed')
+        grounds_dataset_updates.inc(status='failed')
+    finally:
+        grounds_dataset_update_duration.set(default_timer() - begin)
 
 
 def get_grounds_source_api_version(url):
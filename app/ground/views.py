@@ -1,5 +1,8 @@
 from flask import Blueprint, request, abort
 from app.auth.helper import token_required
+from app.database import read_replica
+from app.cache import cached_response
+from app.conditional import conditional
 from app.ground.helper import begin_sheduled_updating_grounds_dataset, response, response_for_ground, response_for_grounds, get_ground_json_list, \
     get_ground_geojson_list, response_with_pagination, paginate_grounds
 from app.models import User, Ground
@@ -12,7 +15,9 @@ def record(state):
     begin_sheduled_updating_grounds_dataset(state)
 
 @ground.route('/grounds/', methods=['GET'])
+@read_replica
 @token_required
+@cached_response()
 def grounds(current_user):
     """
     Return all grounds on order to closing distance to user and limit them to 10.
@@ -94,7 +99,10 @@ def grounds_geography(current_user):
 
 
 @ground.route('/grounds/<ground_id>', methods=['GET'])
+@read_replica
 @token_required
+@conditional(Ground.get_modified_at)
+@cached_response('ground_id')
 def get_ground(current_user, ground_id):
     """
     Return a user ground with the supplied user Id.
@@ -0,0 +1,66 @@
+import threading
+from timeit import default_timer
+from eventlet import tpool
+from eventlet.patcher import is_monkey_patched
+from app import app, bcrypt
+
+
+class PasswordHasher(object):
+    """
+    Runs bcrypt hashing and checking with bounded concurrency.
+    Under eventlet the work goes to the native thread pool of eventlet.tpool, so the hub
+    keeps serving other requests and sockets while a hash is computed. Calls over the
+    concurrency limit wait in a queue, which is reported by stats() with the call timings.
+    """
+
+    def __init__(self, max_concurrency):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.hashing_seconds = 0.0
+        self.waiting_seconds = 0.0
+
+    def generate_password_hash(self, password):
+        return self._execute(bcrypt.generate_password_hash, password, app.config.get('BCRYPT_LOG_ROUNDS')).decode('utf-8')
+
+    def check_password_hash(self, pw_hash, password):
+        return self._execute(bcrypt.check_password_hash, pw_hash, password)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'waiting': self.waiting,
+                'running': self.running,
+                'completed': self.completed,
+                'hashing_seconds': self.hashing_seconds,
+                'waiting_seconds': self.waiting_seconds
+            }
+
+    def _execute(self, f, *args):
+        queued_at = default_timer()
+        with self.lock:
+            self.waiting += 1
+
+        with self.semaphore:
+            started_at = default_timer()
+            with self.lock:
+                self.waiting -= 1
+                self.running += 1
+
+            try:
+                if is_monkey_patched('thread'):
+                    return tpool.execute(f, *args)
+                return f(*args)
+            finally:
+                finished_at = default_timer()
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.hashing_seconds += finished_at - started_at
+                    self.waiting_seconds += started_at - queued_at
+
+
+password_hasher = PasswordHasher(app.config['HASHING_MAX_CONCURRENCY'])
@@ -0,0 +1,97 @@
+import json
+import logging
+import random
+import sys
+from datetime import datetime
+
+SQL_LOGGER_NAME = 'sqlalchemy.engine'
+
+# LogRecord attributes which are not passed through `extra`
+RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line, with the fields passed through `extra`.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Pass only a random share of the records of a logger and its children,
+    warnings and errors always pass.
+    """
+
+    def __init__(self, name, rate):
+        super(SamplingFilter, self).__init__()
+        self.prefix = name + '.'
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not (record.name + '.').startswith(self.prefix):
+            return True
+        return random.random() < self.rate
+
+
+def parse_levels(value):
+    """
+    Parse per module levels written as 'app.event=DEBUG,sqlalchemy.pool=INFO'.
+    :param value: Comma separated logger=level pairs
+    :return: Dict of logger names and levels
+    """
+    levels = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(app):
+    """
+    Send all logging to one stdout handler, in JSON lines unless LOG_FORMAT is 'text',
+    at LOG_LEVEL with LOG_LEVELS overrides per module.
+    SQL statements are logged only for a share SQL_LOG_SAMPLE_RATE of them.
+    :param app: Flask application
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if app.config['LOG_FORMAT'] == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(app.config['LOG_LEVEL'])
+
+    # records of the flask app logger go to the root handler only
+    app.logger.handlers = []
+    app.logger.propagate = True
+
+    sql_sample_rate = app.config['SQL_LOG_SAMPLE_RATE']
+    if sql_sample_rate > 0:
+        logging.getLogger(SQL_LOGGER_NAME).setLevel(logging.INFO)
+        if sql_sample_rate < 1:
+            handler.addFilter(SamplingFilter(SQL_LOGGER_NAME, sql_sample_rate))
+    else:
+        logging.getLogger(SQL_LOGGER_NAME).setLevel(logging.WARNING)
+
+    for name, level in app.config['LOG_LEVELS'].items():
+        logging.getLogger(name).setLevel(level)
@@ -0,0 +1,103 @@
+from timeit import default_timer
+from flask import g, request
+from app import app, db, sockets
+from app.database import REPLICA_BIND, pool_stats
+from app.hashing import password_hasher
+from app.metrics.registry import Registry
+
+CHAT_NAMESPACE = '/event/messages'
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+registry = Registry()
+
+
+def engines():
+    """
+    Engines of the primary database and of the replica if it is configured.
+    :return: Dict of bind names and engines
+    """
+    result = {'primary': db.engine}
+    if REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        result[REPLICA_BIND] = db.get_engine(app, bind=REPLICA_BIND)
+    return result
+
+
+def collect_pool(field):
+    def collect():
+        values = {}
+        for bind, engine in engines().items():
+            stats = pool_stats(engine)
+            if field in stats:
+                values[(bind,)] = stats[field]
+        return values
+
+    return collect
+
+
+def collect_hashing(field):
+    return lambda: {(): password_hasher.stats()[field]}
+
+
+def chat_rooms():
+    """
+    Connections and event rooms of this worker in the chat namespace.
+    :return: Connected session ids and room names
+    """
+    rooms = dict(sockets.server.manager.rooms.get(CHAT_NAMESPACE, {}))
+    connected = set(rooms.get(None, {}))
+    return connected, [room for room in rooms if room is not None and room not in connected]
+
+
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('blueprint', 'endpoint', 'method'))
+http_request_queries = registry.histogram(
+    'http_request_queries', 'SQL queries per HTTP request', ('blueprint', 'endpoint', 'method'), QUERY_COUNT_BUCKETS)
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests', ('blueprint', 'endpoint', 'method', 'status'))
+
+registry.gauge('db_pool_checked_out', 'Connections in use', ('bind',), collect_pool('checked_out'))
+registry.gauge('db_pool_checked_in', 'Idle connections in the pool', ('bind',), collect_pool('checked_in'))
+registry.gauge('db_pool_overflow', 'Connections opened over the pool size', ('bind',), collect_pool('overflow'))
+registry.gauge('db_pool_waiting', 'Checkouts waiting for a connection', ('bind',), collect_pool('waiting'))
+registry.counter('db_pool_checkouts_total', 'Connection checkouts', ('bind',), collect_pool('checkouts'))
+registry.counter('db_pool_timeouts_total', 'Checkouts failed on pool timeout', ('bind',), collect_pool('timeouts'))
+registry.counter('db_pool_wait_seconds_total', 'Time spent waiting for a connection', ('bind',), collect_pool('wait_seconds'))
+
+registry.gauge('socketio_connections', 'Connected chat clients', (), lambda: {(): len(chat_rooms()[0])})
+registry.gauge('socketio_rooms', 'Event chat rooms with clients', (), lambda: {(): len(chat_rooms()[1])})
+
+chat_messages = registry.counter('chat_messages_total', 'Chat messages sent', ('transport',))
+chat_messages_stored = registry.counter('chat_messages_stored_total', 'Chat messages stored by the write buffer')
+
+grounds_dataset_updates = registry.counter('grounds_dataset_updates_total', 'Grounds dataset updates', ('status',))
+grounds_dataset_update_duration = registry.gauge(
+    'grounds_dataset_update_duration_seconds', 'Duration of the last grounds dataset update')
+grounds_dataset_update_rows = registry.gauge('grounds_dataset_update_rows', 'Source rows of the last grounds dataset update')
+
+registry.gauge('hashing_waiting', 'Password hashing calls waiting', (), collect_hashing('waiting'))
+registry.gauge('hashing_running', 'Password hashing calls running', (), collect_hashing('running'))
+registry.counter('hashing_completed_total', 'Password hashing calls completed', (), collect_hashing('completed'))
+registry.counter('hashing_seconds_total', 'Time spent hashing passwords', (), collect_hashing('hashing_seconds'))
+registry.counter('hashing_waiting_seconds_total', 'Time password hashing calls waited', (), collect_hashing('waiting_seconds'))
+
+
+def observe_request(response):
+    """
+    Record the latency and query count of the request.
+    :param response: Http Response
+    :return: Http Response
+    """
+    profile = g.get('profile')
+    if profile is None:
+        return response
+
+    labels = {
+        'blueprint': request.blueprint or '',
+        'endpoint': request.endpoint or '',
+        'method': request.method
+    }
+
+    http_request_duration.observe(default_timer() - profile.started_at, **labels)
+    http_request_queries.observe(profile.query_count, **labels)
+    http_requests.inc(status=response.status_code, **labels)
+    return response
@@ -0,0 +1,20 @@
+from flask import Blueprint, request
+from app import app
+from app.metrics.helper import registry
+
+# Initialize blueprint
+metrics = Blueprint('metrics', __name__)
+
+
+@metrics.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Metrics of this worker in the Prometheus text format.
+    When METRICS_TOKEN is set scrapers have to send it as a bearer token.
+    :return: Http Response
+    """
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != 'Bearer ' + token:
+        return app.response_class('Unauthorized\n', status=401, mimetype='text/plain')
+
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -2,9 +2,13 @@ import datetime
 import jwt
 import math
 from enum import Enum
-from app import app, db, bcrypt
-from sqlalchemy import orm, func, and_, or_, case
+from app import app, db
+from app.cache import response_cache, ground_scope
+from app.hashing import password_hasher
+from sqlalchemy import orm, func, and_, or_, case, exists, select, union_all
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import expression
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.associationproxy import association_proxy
@@ -14,11 +18,29 @@ team_participants_table = db.Table('teamparticipants', db.Model.metadata,
     db.Column('paricipant_id', db.Integer, db.ForeignKey('users.id'), primary_key=True) 
 )
 
+db.Index('ix_teamparticipants_paricipant_id_team_id', team_participants_table.c.paricipant_id, team_participants_table.c.team_id)
+
 user_ratings_table = db.Table('userratings', db.Model.metadata,
     db.Column('rated_user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('rated_by_user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True) 
 )
 
+# Count of teams shared by every pair of users, kept in both directions
+teammate_counts_table = db.Table('teammate_counts', db.Model.metadata,
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Column('teammate_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Column('shared_teams', db.Integer, nullable=False)
+)
+
+db.Index('ix_teammate_counts_user_id_shared_teams', teammate_counts_table.c.user_id, teammate_counts_table.c.shared_teams.desc())
+
+# Login attempt token buckets shared by the workers
+login_buckets_table = db.Table('login_buckets', db.Model.metadata,
+    db.Column('key', db.String(255), primary_key=True),
+    db.Column('tokens', db.Float, nullable=False),
+    db.Column('updated_at', db.DateTime, nullable=False, index=True)
+)
+
 class User(db.Model):
     """
     Table schema
@@ -34,10 +56,14 @@ class User(db.Model):
 
     birthday = db.Column(db.DateTime, nullable=False)
     image_url = db.Column(db.Text, nullable=True)
+    # urls of the image thumbnails by size, generated in the background after an upload
+    image_thumbnails = db.Column(db.JSON, nullable=True)
     
-    rating = db.Column(db.Integer, default=0, nullable=False)
+    rating = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     registered_on = db.Column(db.DateTime, nullable=False)
+    # changes whenever the public representation of the user does
+    modified_at = db.Column(db.DateTime, nullable=False)
 
     events = db.relationship('Event', back_populates='owner', lazy='dynamic')
     teams = db.relationship('Team', secondary=team_participants_table, back_populates='participants', lazy='dynamic')
@@ -52,7 +78,7 @@ class User(db.Model):
 
     def __init__(self, email, password, name, surname, birthday, image_url=None):
         self.email = email
-        self.password = bcrypt.generate_password_hash(password, app.config.get('BCRYPT_LOG_ROUNDS')).decode('utf-8')
+        self.password = password_hasher.generate_password_hash(password)
 
         self.name = name
         self.surname = surname
@@ -61,6 +87,7 @@ class User(db.Model):
         self.image_url = image_url
 
         self.registered_on = datetime.datetime.utcnow()
+        self.modified_at = self.registered_on
         #non orm field
         self.commonTeams = None
 
@@ -80,22 +107,48 @@ class User(db.Model):
         return self.encode_auth_token(self.id)
 
     def update(self, image_url=None):
-        if image_url:
+        if image_url and image_url != self.image_url:
             self.image_url = image_url
+            self.image_thumbnails = None
+            self.modified_at = datetime.datetime.utcnow()
         db.session.commit()
 
-    def json(self, other_user=None):
+    def image_thumbnail_urls(self):
+        """
+        Urls of the user image by thumbnail size, the original image url for every
+        size until the thumbnails are generated.
+        :return:
+        """
+        if not self.image_url:
+            return None
+
+        if self.image_thumbnails:
+            return self.image_thumbnails
+
+        return {str(size): self.image_url for size in app.config['AVATAR_THUMBNAIL_SIZES']}
+
+    def json(self, other_user=None, rated_user_ids=None):
+        """
+        Json representation of the model
+        :param other_user: User viewing this one, adds the 'rated' attribute
+        :param rated_user_ids: Ids rated by other_user resolved by User.rated_user_ids
+        :return:
+        """
         json = {
             'id': self.id,
             'name': self.name,
             'surname': self.surname,
             'birthday': self.birthday.replace(microsecond=0, tzinfo=datetime.timezone.utc).isoformat(),
             'image_url': self.image_url,
-            'rating': len(self.rated_me_users)
+            'image_thumbnail_urls': self.image_thumbnail_urls(),
+            'rating': self.rating
         }
 
         if other_user:
-            json['rated'] = self.rated_by_user(other_user)
+            if rated_user_ids is not None:
+                json['rated'] = self.id in rated_user_ids
+            else:
+                json['rated'] = self.rated_by_user(other_user)
 
         return json
 
@@ -107,7 +160,8 @@ class User(db.Model):
             'surname': self.surname,
             'birthday': self.birthday.replace(microsecond=0, tzinfo=datetime.timezone.utc).isoformat(),
             'image_url': self.image_url,
-            'rating': len(self.rated_me_users),
+            'image_thumbnail_urls': self.image_thumbnail_urls(),
+            'rating': self.rating,
             'rated': self.rated_by_user(self)
         }
 
@@ -140,16 +194,86 @@ class User(db.Model):
         :param new_password: New User Password
         :return:
         """
-        self.password = bcrypt.generate_password_hash(new_password, app.config.get('BCRYPT_LOG_ROUNDS')) \
-            .decode('utf-8')
+        self.password = password_hasher.generate_password_hash(new_password)
         db.session.commit()
 
     def rated_by_user(self, user):
+        """
+        Check whether the user has rated this one with a keyed lookup on userratings.
+        Rows are stored the way `rated_me_users` appends them: the rated user id lives
+        in `rated_by_user_id` and the rating user id in `rated_user_id`.
+        :param user: Rating User
+        :return:
+        """
         if self.id == user.id:
             return True
-        else:
-            print(self.rated_me_users)
-            return user in self.rated_me_users
+
+        return db.session.query(exists().where(and_(
+            user_ratings_table.c.rated_by_user_id == self.id,
+            user_ratings_table.c.rated_user_id == user.id
+        ))).scalar()
+
+    def rate(self, user):
+        """
+        Rate this user on behalf of the given user and increment the rating counter
+        in the same transaction.
+        :param user: Rating User
+        :return: False if the user has already rated this one
+        """
+        try:
+            db.session.execute(user_ratings_table.insert().values(rated_by_user_id=self.id, rated_user_id=user.id))
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+        self.rating = User.rating + 1
+        self.modified_at = datetime.datetime.utcnow()
+        db.session.commit()
+        return True
+
+    def unrate(self, user):
+        """
+        Remove the rating given by the user and decrement the rating counter
+        in the same transaction.
+        :param user: Rating User
+        :return: False if the user has not rated this one
+        """
+        result = db.session.execute(user_ratings_table.delete().where(and_(
+            user_ratings_table.c.rated_by_user_id == self.id,
+            user_ratings_table.c.rated_user_id == user.id
+        )))
+
+        if result.rowcount == 0:
+            db.session.rollback()
+            return False
+
+        self.rating = User.rating - 1
+        self.modified_at = datetime.datetime.utcnow()
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def rated_user_ids(user, user_ids):
+        """
+        Resolve which of the given users were rated by the user in one userratings query.
+        The user is considered to have rated themself, the same as rated_by_user does.
+        :param user: Rating User
+        :param user_ids: Ids of rated users candidates
+        :return: Set of rated user ids
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return set()
+
+        rows = db.session.query(user_ratings_table.c.rated_by_user_id) \
+            .filter(user_ratings_table.c.rated_user_id == user.id) \
+            .filter(user_ratings_table.c.rated_by_user_id.in_(user_ids)) \
+            .all()
+
+        rated_ids = set(map(lambda r: r[0], rows))
+        if user.id in user_ids:
+            rated_ids.add(user.id)
+        return rated_ids
 
     @hybrid_property
     def age(self):
@@ -258,6 +382,10 @@ class Ground(db.Model):
     create_at = db.Column(db.DateTime, nullable=False)
     modified_at = db.Column(db.DateTime, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_grounds_latitude_longitude', 'latitude', 'longitude'),
+    )
+
     gactivities = db.relationship('GroundActivity', back_populates='ground', collection_class=set, cascade="all, delete-orphan")
     events = db.relationship('Event', back_populates='ground', lazy='dynamic')
 
@@ -315,6 +443,7 @@ class Ground(db.Model):
         self.hasDressingRoom = hasDressingRoom
         self.hasLighting = hasLighting
         self.paid = paid
+        self.modified_at = datetime.datetime.utcnow()
         db.session.commit()
 
     def delete(self):
@@ -371,6 +500,10 @@ class Ground(db.Model):
     def get_by_id(id):
         return Ground.query.filter_by(id=id).first()
 
+    @staticmethod
+    def get_modified_at(id):
+        return db.session.query(Ground.modified_at).filter_by(id=int(id)).scalar()
+
     @staticmethod
     def get_by_source_id(source_id):
         return Ground.query.filter_by(source_id=source_id).first()
@@ -546,6 +679,9 @@ class EventParticipantsLevel(Enum):
 class Event(db.Model):
 
     __tablename__ = 'events'
+    __table_args__ = (
+        db.Index('ix_events_ground_id_begin_at', 'ground_id', 'begin_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -615,25 +751,31 @@ class Event(db.Model):
     def save(self):
         db.session.add(self)
         db.session.commit()
+        response_cache.bump(ground_scope(self.ground_id))
 
     def update(self, title=None, description=None):
         if title is not None:
             self.title = title
         if description is not None:
             self.description = description
+        self.modified_at = datetime.datetime.utcnow()
         db.session.commit()
 
     def cancel(self):
         self.canceled = True
+        self.modified_at = datetime.datetime.utcnow()
         db.session.commit()
+        response_cache.bump(ground_scope(self.ground_id))
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
 
-    def json(self, user=None):
+    def json(self, user=None, summary=False):
         """
         Json representation of the model
+        :param user: User viewing the event, adds the 'participated' attribute
+        :param summary: Report teams occupancy without participants
         :return:
         """
         json = {
@@ -643,7 +785,7 @@ class Event(db.Model):
             'activity': self.activity.value,
             'status': self.status.value,
             'type': self.type.value,
-            str(self.type.name): self.subevent.json(),
+            str(self.type.name): self.subevent.json(summary),
             'requiredLevel': self.participants_level.value,
             'requiredAgeFrom': self.participants_age_from,
             'requiredAgeTo': self.participants_age_to,
@@ -654,11 +796,7 @@ class Event(db.Model):
         }
 
         if user:
-            participated = False
-            for t in self.teams:
-                if user in t.participants:
-                    participated = True
-            json['participated'] = participated
+            json['participated'] = len(self.participant_team_ids(user, self.teams)) > 0
 
         return json
 
@@ -705,7 +843,7 @@ class Event(db.Model):
     def init_training(user, title, description, activity, participants_level, participants_age_from, participants_age_to, begin_at, end_at, max_participants):
         event = Event(user, title, description, activity, EventType.training, participants_level, participants_age_from, participants_age_to, begin_at, end_at)
         training = TrainingEvent(max_participants)
-        training.team.participants.append(user)
+        training.team.add_participant(user)
         event.training = training
         
         return event
@@ -714,7 +852,7 @@ class Event(db.Model):
     def init_match(user, title, description, activity, participants_level, participants_age_from, participants_age_to, begin_at, end_at, teams_size):
         event = Event(user, title, description, activity, EventType.match, participants_level, participants_age_from, participants_age_to, begin_at, end_at)
         match = MatchEvent(teams_size)
-        match.team_a.participants.append(user)
+        match.team_a.add_participant(user)
         event.match = match
 
         return event
@@ -723,15 +861,124 @@ class Event(db.Model):
     def init_tourney(user, title, description, activity, participants_level, participants_age_from, participants_age_to, begin_at, end_at, teams_size, teams_count=3):
         event = Event(user, title, description, activity, EventType.tourney, participants_level, participants_age_from, participants_age_to, begin_at, end_at)
         tourney = TourneyEvent(teams_size, teams_count)
-        tourney.teams[0].participants.append(user)
+        tourney.teams[0].add_participant(user)
         event.tourney = tourney
 
         return event
 
+    def lock_teams(self):
+        """
+        Lock the event teams with SELECT ... FOR UPDATE until the end of the transaction.
+        Teams are locked in id order, so concurrent joins and leaves can't deadlock.
+        :return: Locked teams with fresh participant counts
+        """
+        team_ids = list(map(lambda t: t.id, self.teams))
+        return Team.query.filter(Team.id.in_(team_ids)) \
+            .order_by(Team.id) \
+            .with_for_update() \
+            .populate_existing() \
+            .all()
+
+    def participant_team_ids(self, user, teams):
+        rows = db.session.query(team_participants_table.c.team_id) \
+            .filter(team_participants_table.c.team_id.in_(list(map(lambda t: t.id, teams)))) \
+            .filter(team_participants_table.c.paricipant_id == user.id) \
+            .all()
+        return set(map(lambda r: r[0], rows))
+
+    def join(self, user, team):
+        """
+        Add the user to the team, moving them out of the other event teams, in one transaction.
+        :param user: Joining User
+        :param team: Team of the event
+        :raises ValueError: If the user already is in the team or the team is full
+        """
+        teams = self.lock_teams()
+        joined_team_ids = self.participant_team_ids(user, teams)
+
+        if team.id in joined_team_ids:
+            db.session.rollback()
+            raise ValueError('User already joined to the team')
+
+        team = next(filter(lambda t: t.id == team.id, teams))
+        if team.participant_count >= team.max_participants:
+            db.session.rollback()
+            raise ValueError('Team is full')
+
+        for t in teams:
+            if t.id in joined_team_ids:
+                t.remove_participant_row(user)
+
+        team.add_participant_row(user)
+        self.modified_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+    def leave(self, user):
+        """
+        Remove the user from the event team in one transaction.
+        :param user: Leaving User
+        :raises ValueError: If the user isn't in any team of the event
+        """
+        teams = self.lock_teams()
+        joined_team_ids = self.participant_team_ids(user, teams)
+
+        if not joined_team_ids:
+            db.session.rollback()
+            raise ValueError('Team to leave cannot be found')
+
+        for t in teams:
+            if t.id in joined_team_ids:
+                t.remove_participant_row(user)
+
+        self.modified_at = datetime.datetime.utcnow()
+        db.session.commit()
+
     @staticmethod
     def get_by_id(id):
         return Event.query.filter_by(id=id).first()
 
+    @staticmethod
+    def get_modified_at(id):
+        """
+        Modification time of the event representation, the latest one of the event, its
+        ground, its owner, its teams and their participants. The status changes without
+        a write when the event begins and ends, so those moments count as modifications too.
+        :param id: Event Id
+        :return:
+        """
+        id = int(id)
+        owner = orm.aliased(User)
+        team_ids = union_all(
+            select([TrainingEvent.team_id]).where(TrainingEvent.event_id == id),
+            select([MatchEvent.team_a_id]).where(MatchEvent.event_id == id),
+            select([MatchEvent.team_b_id]).where(MatchEvent.event_id == id),
+            select([Team.id]).where(Team.tourney_id == id)
+        )
+        teams_modified_at = select([func.max(Team.modified_at)]) \
+            .where(Team.id.in_(team_ids)) \
+            .as_scalar()
+        participants_modified_at = select([func.max(User.modified_at)]) \
+            .select_from(team_participants_table.join(User, User.id == team_participants_table.c.paricipant_id)) \
+            .where(team_participants_table.c.team_id.in_(team_ids)) \
+            .as_scalar()
+
+        row = db.session.query(Event.modified_at, Event.begin_at, Event.end_at, Ground.modified_at, owner.modified_at,
+                               teams_modified_at, participants_modified_at) \
+            .outerjoin(Ground, Ground.id == Event.ground_id) \
+            .outerjoin(owner, owner.id == Event.owner_id) \
+            .filter(Event.id == id) \
+            .first()
+        if not row:
+            return None
+
+        today = datetime.datetime.utcnow()
+        modified_at = max(filter(None, [row[0]] + list(row[3:])))
+        if today >= row.begin_at:
+            modified_at = max(modified_at, row.begin_at)
+        if today > row.end_at:
+            modified_at = max(modified_at, row.end_at)
+        return modified_at
+
     @staticmethod
     def get_by_ground_id(ground_id):
         return Event.query.filter_by(ground_id=ground_id).first()
@@ -763,9 +1010,9 @@ class TrainingEvent(db.Model):
     def __init__(self, max_participants):
         self.team = Team(max_participants)
 
-    def json(self):
+    def json(self, summary=False):
         return {
-            'team': self.team.json()
+            'team': self.team.summary_json() if summary else self.team.json()
         }
 
 class MatchEvent(db.Model):
@@ -792,9 +1039,18 @@ class MatchEvent(db.Model):
     def update(self, scoreA, scoreB):
         self.team_a_score = scoreA
         self.team_b_score = scoreB
+        self.event.modified_at = datetime.datetime.utcnow()
         db.session.commit()
 
-    def json(self):
+    def json(self, summary=False):
+        if summary:
+            return {
+                'scoreA': self.team_a_score,
+                'scoreB': self.team_b_score,
+                'teamA': self.team_a.summary_json(),
+                'teamB': self.team_b.summary_json()
+            }
+
         return {
             'scoreA': self.team_a_score,
             'scoreB': self.team_b_score,
@@ -824,11 +1080,12 @@ class TourneyEvent(db.Model):
         if teams_diff > 0:
             for i in range(teams_diff):
                 self.teams.append(Team(teams_size))
+            self.event.modified_at = datetime.datetime.utcnow()
 
-    def json(self):
+    def json(self, summary=False):
         return {
             'teamsCount': len(self.teams),
-            'teams': list(map(lambda t: t.json(), self.teams))
+            'teams': list(map(lambda t: t.summary_json() if summary else t.json(), self.teams))
         }
 
 class Team(db.Model):
@@ -837,19 +1094,30 @@ class Team(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     max_participants = db.Column(db.Integer, nullable=False)
 
-    tourney_id = db.Column(db.Integer, db.ForeignKey('tourneyevents.event_id'), nullable=True)
+    tourney_id = db.Column(db.Integer, db.ForeignKey('tourneyevents.event_id'), nullable=True, index=True)
 
     create_at = db.Column(db.DateTime, nullable=False)
     modified_at = db.Column(db.DateTime, nullable=False)
 
+    participant_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
     participants = db.relationship('User', secondary=team_participants_table, back_populates='teams', lazy='dynamic')
 
     def __init__(self, max_participants):
         self.max_participants = max_participants
+        self.participant_count = 0
 
         self.create_at = datetime.datetime.utcnow()
         self.modified_at = datetime.datetime.utcnow()
 
+        #non orm field
+        self.preloaded_participants = None
+
+    @orm.reconstructor
+    def init_on_load(self):
+        #non orm field
+        self.preloaded_participants = None
+
     def save(self):
         db.session.add(self)
         db.session.commit()
@@ -861,11 +1129,89 @@ class Team(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def json(self):
+    def add_participant(self, user):
+        """
+        Add the user to a new team and count them.
+        :param user: User
+        """
+        self.participants.append(user)
+        self.participant_count += 1
+
+    def add_participant_row(self, user):
+        """
+        Insert the membership of the user into a locked team and count them.
+        :param user: User
+        """
+        teammate_ids = self.participant_ids()
+        db.session.execute(team_participants_table.insert().values(team_id=self.id, paricipant_id=user.id))
+        self.participant_count += 1
+        self.modified_at = datetime.datetime.utcnow()
+
+        if teammate_ids:
+            rows = []
+            for teammate_id in teammate_ids:
+                rows.append({'user_id': user.id, 'teammate_id': teammate_id, 'shared_teams': 1})
+                rows.append({'user_id': teammate_id, 'teammate_id': user.id, 'shared_teams': 1})
+            rows.sort(key=lambda r: (r['user_id'], r['teammate_id']))
+
+            statement = pg_insert(teammate_counts_table).values(rows)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[teammate_counts_table.c.user_id, teammate_counts_table.c.teammate_id],
+                set_={'shared_teams': teammate_counts_table.c.shared_teams + 1}
+            ))
+
+    def remove_participant_row(self, user):
+        """
+        Delete the membership of the user from a locked team and uncount them.
+        :param user: User
+        """
+        db.session.execute(team_participants_table.delete().where(and_(
+            team_participants_table.c.team_id == self.id,
+            team_participants_table.c.paricipant_id == user.id
+        )))
+        self.participant_count -= 1
+        self.modified_at = datetime.datetime.utcnow()
+
+        teammate_ids = self.participant_ids()
+        if teammate_ids:
+            pairs = or_(
+                and_(teammate_counts_table.c.user_id == user.id, teammate_counts_table.c.teammate_id.in_(teammate_ids)),
+                and_(teammate_counts_table.c.teammate_id == user.id, teammate_counts_table.c.user_id.in_(teammate_ids))
+            )
+            db.session.execute(teammate_counts_table.update().where(pairs)
+                .values(shared_teams=teammate_counts_table.c.shared_teams - 1))
+            db.session.execute(teammate_counts_table.delete().where(and_(pairs, teammate_counts_table.c.shared_teams <= 0)))
+
+    def participant_ids(self):
+        rows = db.session.query(team_participants_table.c.paricipant_id) \
+            .filter(team_participants_table.c.team_id == self.id) \
+            .all()
+        return list(map(lambda r: r[0], rows))
+
+    def json(self, user=None, rated_user_ids=None):
+        participants = self.preloaded_participants
+        if participants is None:
+            participants = self.participants.all()
+
+        if user and rated_user_ids is None:
+            rated_user_ids = User.rated_user_ids(user, map(lambda p: p.id, participants))
+
         return {
             'id': self.id, 
             'maxParticipants': self.max_participants,
-            'participants': list(map(lambda p: p.json(), self.participants))
+            'participantsCount': self.participant_count,
+            'participants': list(map(lambda p: p.json(user, rated_user_ids), participants))
+        }
+
+    def summary_json(self):
+        """
+        Compact representation reporting the team occupancy without participants
+        :return:
+        """
+        return {
+            'id': self.id,
+            'maxParticipants': self.max_participants,
+            'participantsCount': self.participant_count
         }
 
     @property
@@ -886,14 +1232,60 @@ class Team(db.Model):
 
     @property
     def is_full(self):
-        return self.participants.count() == self.max_participants
+        return self.participant_count >= self.max_participants
+
+    @staticmethod
+    def preload_participants(teams):
+        """
+        Load the participants of all the teams with one IN query.
+        :param teams: Teams
+        :return: Participants of all the teams
+        """
+        teams_by_id = {}
+        for team in teams:
+            team.preloaded_participants = []
+            teams_by_id[team.id] = team
+
+        if not teams_by_id:
+            return []
+
+        rows = db.session.query(team_participants_table.c.team_id, User) \
+            .select_from(team_participants_table) \
+            .join(User, User.id == team_participants_table.c.paricipant_id) \
+            .filter(team_participants_table.c.team_id.in_(list(teams_by_id.keys()))) \
+            .all()
+
+        for team_id, user in rows:
+            teams_by_id[team_id].preloaded_participants.append(user)
+
+        return list(map(lambda r: r[1], rows))
 
     @staticmethod
     def get_by_id(id):
         return Team.query.filter_by(id=id).first()
 
+    @staticmethod
+    def get_modified_at(id):
+        """
+        Modification time of the team representation, the latest one of the team and its participants.
+        :param id: Team Id
+        :return:
+        """
+        row = db.session.query(Team.modified_at, func.max(User.modified_at)) \
+            .outerjoin(team_participants_table, team_participants_table.c.team_id == Team.id) \
+            .outerjoin(User, User.id == team_participants_table.c.paricipant_id) \
+            .filter(Team.id == int(id)) \
+            .group_by(Team.id) \
+            .first()
+        if not row:
+            return None
+        return max(filter(None, row))
+
 class EventMessage(db.Model):
     __tablename__ = 'eventmessages'
+    __table_args__ = (
+        db.Index('ix_eventmessages_event_id_create_at_id', 'event_id', 'create_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     event_id = db.Column(db.Integer, db.ForeignKey('events.id'))
@@ -906,8 +1298,15 @@ class EventMessage(db.Model):
     event = db.relationship('Event', back_populates='messages')
     sender = db.relationship('User', back_populates='messages')
 
-    def __init__(self, sender, text):
-        self.sender = sender
+    def __init__(self, sender, text, event_id=None):
+        if isinstance(sender, User):
+            self.sender = sender
+        else:
+            self.sender_id = sender
+
+        if event_id is not None:
+            self.event_id = event_id
+
         self.text = text
 
         self.create_at = datetime.datetime.utcnow()
@@ -920,10 +1319,19 @@ class EventMessage(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def json(self):
+    def json(self, user=None, rated_user_ids=None):
+        return self.json_with_sender(self.sender.json(user, rated_user_ids))
+
+    def json_with_sender(self, sender):
+        """
+        Json representation of the model with an already serialized sender
+        :param sender: Sender json
+        :return:
+        """
         return {
+            'id': self.id,
             'eventId': self.event_id,
-            'sender': self.sender.json(),
+            'sender': sender,
             'text': self.text,
             'createdAt': self.create_at.replace(microsecond=0, tzinfo=datetime.timezone.utc).isoformat()
         }
\ No newline at end of file
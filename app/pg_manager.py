@@ -0,0 +1,149 @@
+import base64
+import logging
+import pickle
+import select
+import threading
+import uuid
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, quote_ident
+from socketio import PubSubManager
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_MAX_BYTES = 7999
+# larger messages are split in chunks prefixed with '#<message id>:<index>:<count>:',
+# the prefix is not part of the base64 alphabet so single payloads stay unchanged
+NOTIFY_CHUNK_PREFIX = '#'
+NOTIFY_CHUNK_DATA_BYTES = NOTIFY_PAYLOAD_MAX_BYTES - 64
+LISTEN_POLL_TIMEOUT_SECONDS = 5
+LISTEN_RECONNECT_DELAY_SECONDS = 1
+
+POSTGRES_URL_SCHEMES = ('postgres://', 'postgresql://')
+
+logger = logging.getLogger(__name__)
+
+
+def is_postgres_url(url):
+    return bool(url) and url.startswith(POSTGRES_URL_SCHEMES)
+
+
+class PostgresManager(PubSubManager):
+    """
+    Socket.IO client manager that shares events between processes through
+    PostgreSQL LISTEN/NOTIFY, so several workers can serve the same chat rooms
+    without a Redis or AMQP server.
+    Every process publishes with pg_notify on the channel and keeps one
+    dedicated connection listening on it. For example two local processes
+    started with SOCKETIO_MESSAGE_QUEUE=postgresql://localhost/sg and
+    PORT=5000 and PORT=5001 deliver chat messages to each other's rooms.
+    Messages over the NOTIFY payload limit are sent as several notifications in
+    one statement, so they are delivered together or not at all, and joined back
+    by the listeners.
+    """
+    name = 'postgres'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None):
+        super(PostgresManager, self).__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url
+        # publishing greenlets take turns on the one publish connection
+        self.publish_lock = threading.Lock()
+        self.publish_connection = None
+
+    def initialize(self):
+        super(PostgresManager, self).initialize()
+
+        if self.server.async_mode == 'eventlet':
+            from eventlet.patcher import is_monkey_patched
+            if not is_monkey_patched('select'):
+                raise RuntimeError('PostgreSQL message queue requires a monkey patched select library to work with eventlet')
+
+    def _connect(self):
+        connection = psycopg2.connect(self.url)
+        connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    def _publish(self, data):
+        payload = base64.b64encode(pickle.dumps(data)).decode('ascii')
+        if len(payload) > NOTIFY_PAYLOAD_MAX_BYTES:
+            payloads = self._chunk(payload)
+        else:
+            payloads = [payload]
+
+        statement = 'SELECT ' + ', '.join(['pg_notify(%s, %s)'] * len(payloads))
+        parameters = []
+        for payload in payloads:
+            parameters.extend((self.channel, payload))
+
+        with self.publish_lock:
+            retry = True
+            while True:
+                try:
+                    if self.publish_connection is None or self.publish_connection.closed:
+                        self.publish_connection = self._connect()
+                    with self.publish_connection.cursor() as cursor:
+                        cursor.execute(statement, parameters)
+                    return
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    # the connection was dropped, reconnect once before giving up
+                    self._close_publish_connection()
+                    if not retry:
+                        raise
+                    retry = False
+                except psycopg2.Error:
+                    # don't reuse a connection left in an unknown state
+                    self._close_publish_connection()
+                    raise
+
+    @staticmethod
+    def _chunk(payload):
+        """
+        Split a payload over the NOTIFY limit in chunks carrying their position.
+        :param payload: Base64 payload
+        :return: Chunk payloads
+        """
+        message_id = uuid.uuid4().hex
+        parts = [payload[i:i + NOTIFY_CHUNK_DATA_BYTES] for i in range(0, len(payload), NOTIFY_CHUNK_DATA_BYTES)]
+        return ['%s%s:%d:%d:%s' % (NOTIFY_CHUNK_PREFIX, message_id, index, len(parts), part)
+                for index, part in enumerate(parts)]
+
+    def _close_publish_connection(self):
+        if self.publish_connection is not None and not self.publish_connection.closed:
+            try:
+                self.publish_connection.close()
+            except psycopg2.Error:
+                pass
+        self.publish_connection = None
+
+    def _listen(self):
+        while True:
+            connection = None
+            # chunks of the messages being joined back by message id
+            chunks = {}
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute('LISTEN ' + quote_ident(self.channel, connection))
+
+                while True:
+                    readable, _, _ = select.select([connection], [], [], LISTEN_POLL_TIMEOUT_SECONDS)
+                    if not readable:
+                        continue
+
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        if not notify.payload.startswith(NOTIFY_CHUNK_PREFIX):
+                            yield base64.b64decode(notify.payload)
+                            continue
+
+                        message_id, index, count, part = notify.payload[len(NOTIFY_CHUNK_PREFIX):].split(':', 3)
+                        parts = chunks.setdefault(message_id, [None] * int(count))
+                        parts[int(index)] = part
+                        if None not in parts:
+                            del chunks[message_id]
+                            yield base64.b64decode(''.join(parts))
+            except psycopg2.Error as error:
+                logger.warning('PostgreSQL message queue connection lost: %s', error)
+                if connection is not None and not connection.closed:
+                    connection.close()
+                self.server.sleep(LISTEN_RECONNECT_DELAY_SECONDS)
@@ -0,0 +1,93 @@
+import logging
+from timeit import default_timer
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+# bound the statements kept for one request
+MAX_RECORDED_STATEMENTS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfile(object):
+    """
+    Queries and database time of one request.
+    """
+
+    def __init__(self):
+        self.started_at = default_timer()
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.query_count += 1
+        self.db_seconds += seconds
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append((seconds, statement))
+
+    def slowest(self, count):
+        return sorted(self.statements, key=lambda s: s[0], reverse=True)[:count]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started_at = default_timer()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, 'query_started_at', None)
+    if started_at is None or not has_request_context():
+        return
+
+    profile = g.get('profile')
+    if profile is not None:
+        profile.record(statement, default_timer() - started_at)
+
+
+event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def begin_request_profile():
+    g.profile = RequestProfile()
+
+
+def finish_request_profile(response):
+    """
+    Add the Server-Timing header with the query count and database time of the request
+    and log them. Requests slower than SLOW_REQUEST_MS are logged with all their statements.
+    :param response: Http Response
+    :return: Http Response
+    """
+    profile = g.get('profile')
+    if profile is None:
+        return response
+
+    duration_ms = (default_timer() - profile.started_at) * 1000
+    db_ms = profile.db_seconds * 1000
+
+    response.headers['Server-Timing'] = 'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+        db_ms, profile.query_count, duration_ms)
+
+    slowest_count = app.config['PROFILE_SLOWEST_STATEMENTS']
+    log_fields = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 1),
+        'queries': profile.query_count,
+        'db_ms': round(db_ms, 1),
+        'slowest': [{'ms': round(s * 1000, 1), 'statement': q} for s, q in profile.slowest(slowest_count)]
+    }
+
+    if duration_ms >= app.config['SLOW_REQUEST_MS']:
+        log_fields['statements'] = [{'ms': round(s * 1000, 1), 'statement': q} for s, q in profile.statements]
+        logger.warning('Slow request %s %s', request.method, request.path, extra=log_fields)
+    else:
+        logger.info('Request %s %s', request.method, request.path, extra=log_fields)
+
+    return response
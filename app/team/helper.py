@@ -1,6 +1,7 @@
 from flask import make_response, jsonify, url_for
+from flask_sqlalchemy import Pagination
 from app import app, db
-from app.models import Event, Team, User
+from app.models import Event, Team, User, team_participants_table
 
 def response(status, message, code):
     return make_response(jsonify({
@@ -14,10 +15,19 @@ def response_for_team(team):
         'team': team
     }))
 
-def get_team_json_list(teams):
+def get_team_json_list(teams, user=None, summary=False):
+    if summary:
+        return list(map(lambda t: t.summary_json(), teams))
+
+    participants = Team.preload_participants(teams)
+
+    rated_user_ids = None
+    if user:
+        rated_user_ids = User.rated_user_ids(user, map(lambda p: p.id, participants))
+
     json_list = []
     for team in teams:
-        json_list.append(team.json())
+        json_list.append(team.json(user, rated_user_ids))
     return json_list
 
 def response_with_pagination(teams, previous, nex, count):
@@ -31,8 +41,35 @@ def response_with_pagination(teams, previous, nex, count):
 
 
 def paginate_teams(page, user):
-    pagination = Team.query.join(User, Team.participants).filter(User.id==user.id).order_by(Team.create_at.desc()) \
-        .paginate(page=page, per_page=app.config['TEAMS_PER_PAGE'], error_out=False)
+    """
+    Paginate the teams of the user, newest first.
+    Team ids grow with their create time, so the page of team ids is read from the
+    (paricipant_id, team_id) index of teamparticipants alone, without joining users
+    or sorting teams, and only the teams of the page are loaded.
+    :param page: Page number
+    :param user: User
+    :return: Teams of the page, next url, pagination and previous url
+    """
+    page = max(page, 1)
+    per_page = app.config['TEAMS_PER_PAGE']
+
+    memberships = db.session.query(team_participants_table.c.team_id) \
+        .filter(team_participants_table.c.paricipant_id == user.id)
+    total = memberships.count()
+
+    rows = memberships.order_by(team_participants_table.c.team_id.desc()) \
+        .offset((page - 1) * per_page) \
+        .limit(per_page) \
+        .all()
+    team_ids = list(map(lambda r: r[0], rows))
+
+    teams_by_id = {}
+    if team_ids:
+        for team in Team.query.filter(Team.id.in_(team_ids)).all():
+            teams_by_id[team.id] = team
+
+    items = [teams_by_id[i] for i in team_ids if i in teams_by_id]
+    pagination = Pagination(None, page, per_page, total, items)
 
     previous = None
     if pagination.has_prev:
@@ -42,6 +79,4 @@ def paginate_teams(page, user):
     if pagination.has_next:
         nex = url_for('team.teams', page=page + 1, _external=True)
 
-    items = pagination.items
-
     return items, nex, pagination, previous
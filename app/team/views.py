@@ -1,5 +1,7 @@
 from flask import Blueprint, request, abort
 from app.auth.helper import token_required
+from app.database import read_replica
+from app.conditional import conditional
 from app.team.helper import response, response_for_team, response_with_pagination, get_team_json_list, paginate_teams
 from app.models import User, Team
 
@@ -8,20 +10,23 @@ team = Blueprint('team', __name__)
 
 
 @team.route('/teams', methods=['GET'])
+@read_replica
 @token_required
 def teams(current_user):
     user = User.get_by_id(current_user.id)
     page = request.args.get('page', 1, type=int)
+    summary = request.args.get('fields') == 'summary'
 
     items, nex, pagination, previous = paginate_teams(page, user)
 
     if items:
-        return response_with_pagination(get_team_json_list(items), previous, nex, pagination.total)
+        return response_with_pagination(get_team_json_list(items, current_user, summary), previous, nex, pagination.total)
     return response_with_pagination([], previous, nex, 0)
 
 
 @team.route('/teams/<team_id>', methods=['GET'])
 @token_required
+@conditional(Team.get_modified_at, per_user=True)
 def get_team(current_user, team_id):
     try:
         int(team_id)
@@ -30,7 +35,9 @@ def get_team(current_user, team_id):
     else:
         team = Team.get_by_id(team_id)
         if team:
-            return response_for_team(team.json())
+            if request.args.get('fields') == 'summary':
+                return response_for_team(team.summary_json())
+            return response_for_team(team.json(current_user))
         return response('failed', "Team not found", 404)
 
 
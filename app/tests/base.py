@@ -0,0 +1,59 @@
+import json
+from datetime import datetime, timedelta
+from flask_testing import TestCase
+from app import app, db
+from app.cache import response_cache
+from app.models import User, Ground, Event, Activity, EventParticipantsLevel
+
+
+class BaseTestCase(TestCase):
+    """
+    Test case running against the database of the testing configuration,
+    with the tables created before and dropped after every test.
+    """
+
+    def create_app(self):
+        app.config.from_object('app.config.TestingConfig')
+        return app
+
+    def setUp(self):
+        db.create_all()
+        db.session.commit()
+        with response_cache.lock:
+            response_cache.entries.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def create_user(self, email='user@test.com'):
+        user = User(email, 'password', 'Name', 'Surname', datetime(1997, 4, 30))
+        user.save()
+        return user
+
+    def create_ground(self, source_id=1):
+        ground = Ground(source_id, 'Ground', 'District', 'Address', None,
+                        False, False, False, False, False, False, False, 55.75, 37.61)
+        ground.save()
+        return ground
+
+    def create_training(self, owner, ground, max_participants=10):
+        begin_at = datetime.utcnow() + timedelta(days=1)
+        event = Event.init_training(owner, 'Training', 'Description', Activity.football,
+                                    EventParticipantsLevel.beginner, 16, 40, begin_at,
+                                    begin_at + timedelta(hours=2), max_participants)
+        event.ground = ground
+        event.save()
+        return event
+
+    def auth_headers(self, user):
+        token = user.encode_auth_token(user.id).decode('utf-8')
+        return {'Authorization': 'Bearer ' + token}
+
+    def get(self, path, user, **headers):
+        headers.update(self.auth_headers(user))
+        return self.client.get(path, headers=headers)
+
+    def post(self, path, user, data=None):
+        return self.client.post(path, headers=self.auth_headers(user),
+                                data=json.dumps(data or {}), content_type='application/json')
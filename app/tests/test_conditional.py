@@ -0,0 +1,136 @@
+import unittest
+from datetime import timedelta
+from unittest import mock
+from app import db
+from app.models import Event, Team
+from app.tests.base import BaseTestCase
+
+
+class TestGroundConditional(BaseTestCase):
+
+    def test_ground_has_validators(self):
+        user = self.create_user()
+        ground = self.create_ground()
+
+        response = self.get('/grounds/%d' % ground.id, user)
+        self.assert200(response)
+        self.assertIsNotNone(response.headers.get('ETag'))
+        self.assertIsNotNone(response.headers.get('Last-Modified'))
+
+    def test_ground_not_modified(self):
+        user = self.create_user()
+        ground = self.create_ground()
+
+        response = self.get('/grounds/%d' % ground.id, user)
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+
+        response = self.get('/grounds/%d' % ground.id, user, **{'If-None-Match': etag})
+        self.assertStatus(response, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        response = self.get('/grounds/%d' % ground.id, user, **{'If-Modified-Since': last_modified})
+        self.assertStatus(response, 304)
+
+    def test_ground_etag_changes_within_a_second(self):
+        user = self.create_user()
+        ground = self.create_ground()
+        ground.modified_at = ground.modified_at.replace(microsecond=100)
+        db.session.commit()
+
+        etag = self.get('/grounds/%d' % ground.id, user).headers['ETag']
+
+        ground.modified_at = ground.modified_at + timedelta(microseconds=1000)
+        db.session.commit()
+
+        response = self.get('/grounds/%d' % ground.id, user, **{'If-None-Match': etag})
+        self.assert200(response)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_cached_ground_follows_modification_time(self):
+        user = self.create_user()
+        ground = self.create_ground()
+
+        etag = self.get('/grounds/%d' % ground.id, user).headers['ETag']
+
+        # A write from another process leaves the cache generations of this one untouched
+        ground.name = 'Renamed'
+        ground.modified_at = ground.modified_at + timedelta(seconds=1)
+        db.session.commit()
+
+        response = self.get('/grounds/%d' % ground.id, user, **{'If-None-Match': etag})
+        self.assert200(response)
+        self.assertIn(b'Renamed', response.data)
+
+    def test_ground_invalid_and_missing_id(self):
+        user = self.create_user()
+
+        self.assert400(self.get('/grounds/ground', user))
+        self.assert404(self.get('/grounds/100', user))
+
+
+class TestViewerDependentETags(BaseTestCase):
+
+    def test_team_etag_follows_rated_flag(self):
+        viewer = self.create_user('viewer@test.com')
+        owner = self.create_user('owner@test.com')
+        team = self.create_training(owner, self.create_ground()).teams[0]
+
+        response = self.get('/teams/%d' % team.id, viewer)
+        self.assert200(response)
+        etag = response.headers['ETag']
+        self.assertStatus(self.get('/teams/%d' % team.id, viewer, **{'If-None-Match': etag}), 304)
+
+        self.assertStatus(self.post('/users/%d/actions/rate' % owner.id, viewer), 201)
+
+        response = self.get('/teams/%d' % team.id, viewer, **{'If-None-Match': etag})
+        self.assert200(response)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_event_etag_follows_participants(self):
+        viewer = self.create_user('viewer@test.com')
+        owner = self.create_user('owner@test.com')
+        event = self.create_training(owner, self.create_ground())
+
+        response = self.get('/events/%d' % event.id, viewer)
+        self.assert200(response)
+        etag = response.headers['ETag']
+        self.assertStatus(self.get('/events/%d' % event.id, viewer, **{'If-None-Match': etag}), 304)
+
+        self.assertStatus(self.post('/users/%d/actions/rate' % owner.id, viewer), 201)
+
+        response = self.get('/events/%d' % event.id, viewer, **{'If-None-Match': etag})
+        self.assert200(response)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_validators_come_from_modification_times(self):
+        viewer = self.create_user('viewer@test.com')
+        other = self.create_user('other@test.com')
+        event = self.create_training(self.create_user('owner@test.com'), self.create_ground())
+        team = event.teams[0]
+
+        for path in ['/teams/%d' % team.id, '/events/%d' % event.id]:
+            response = self.get(path, viewer)
+            self.assert200(response)
+            self.assertIsNotNone(response.headers.get('Last-Modified'))
+
+            # the representation depends on the viewer, so the ETag does too
+            self.assertNotEqual(self.get(path, other).headers['ETag'], response.headers['ETag'])
+
+            with mock.patch.object(Team, 'json') as team_json, mock.patch.object(Event, 'json') as event_json:
+                response = self.get(path, viewer, **{'If-None-Match': response.headers['ETag']})
+                self.assertStatus(response, 304)
+                team_json.assert_not_called()
+                event_json.assert_not_called()
+
+    def test_invalid_and_missing_ids(self):
+        user = self.create_user()
+
+        self.assert400(self.get('/teams/team', user))
+        self.assert404(self.get('/teams/100', user))
+        self.assert400(self.get('/events/event', user))
+        self.assert404(self.get('/events/100', user))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import unittest
+from flask import g
+from app import app, db
+from app.database import REPLICA_BIND
+from app.models import User
+from app.tests.base import BaseTestCase
+
+REPLICA_URL = os.getenv('DATABASE_TEST_REPLICA_URL')
+
+
+@unittest.skipUnless(REPLICA_URL, 'DATABASE_TEST_REPLICA_URL is not set')
+class TestReadReplica(BaseTestCase):
+    """
+    Route reads between the testing database and a second database standing in for the replica.
+    Rows are copied to the replica by hand, with a different name to tell the databases apart.
+    """
+
+    def setUp(self):
+        self.binds = app.config.get('SQLALCHEMY_BINDS')
+        app.config['SQLALCHEMY_BINDS'] = dict(self.binds or {}, **{REPLICA_BIND: REPLICA_URL})
+        super(TestReadReplica, self).setUp()
+        self.replica = db.get_engine(app, bind=REPLICA_BIND)
+        db.Model.metadata.create_all(bind=self.replica)
+
+    def tearDown(self):
+        db.session.remove()
+        db.Model.metadata.drop_all(bind=self.replica)
+        super(TestReadReplica, self).tearDown()
+        app.config['SQLALCHEMY_BINDS'] = self.binds
+
+    def create_replicated_user(self, email, replica_name):
+        user = self.create_user(email)
+        row = dict((c.name, getattr(user, c.key)) for c in User.__table__.columns)
+        row['name'] = replica_name
+        self.replica.execute(User.__table__.insert().values(row))
+        return user
+
+    def test_view_reads_replica(self):
+        viewer = self.create_replicated_user('viewer@test.com', 'Replica')
+        other = self.create_replicated_user('other@test.com', 'Replica')
+        headers = self.auth_headers(viewer)
+        db.session.remove()
+
+        response = self.client.get('/users/%d' % other.id, headers=headers)
+        self.assert200(response)
+        self.assertEqual(response.json['user']['name'], 'Replica')
+
+        response = self.client.get('/user', headers=headers)
+        self.assert200(response)
+        self.assertEqual(response.json['user']['name'], 'Name')
+
+    def test_session_reads_primary_after_write(self):
+        user = self.create_replicated_user('user@test.com', 'Replica')
+        user_id = user.id
+        db.session.remove()
+
+        with app.test_request_context():
+            g.read_replica = True
+            self.assertEqual(db.session.query(User.name).filter_by(id=user_id).scalar(), 'Replica')
+            self.assertEqual(db.session.query(User.name).filter_by(id=user_id).with_for_update().scalar(), 'Name')
+
+            db.session.query(User).filter_by(id=user_id).update({'surname': 'Updated'})
+            self.assertEqual(db.session.query(User.name).filter_by(id=user_id).scalar(), 'Name')
+            db.session.rollback()
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from urllib.parse import urlsplit
+from app import app
+from app.tests.base import BaseTestCase
+
+
+class TestNearbyEvents(BaseTestCase):
+
+    def nearby(self, user, path):
+        response = self.get(path, user)
+        self.assert200(response)
+        return response.json
+
+    def test_pages_chain_through_equal_scores(self):
+        user = self.create_user()
+        ground = self.create_ground()
+        # events beginning at the same time on one ground share the same score
+        event_ids = [self.create_training(user, ground).id for i in range(app.config['EVENTS_PER_PAGE'] + 3)]
+
+        page = self.nearby(user, '/events/nearby?latitude=55.7513&longitude=37.6142')
+        ids = [e['id'] for e in page['events']]
+        while page['next']:
+            next_url = urlsplit(page['next'])
+            page = self.nearby(user, next_url.path + '?' + next_url.query)
+            ids += [e['id'] for e in page['events']]
+
+        self.assertEqual(ids, sorted(event_ids))
+
+    def test_invalid_after_score(self):
+        user = self.create_user()
+
+        for after_score in ['score', 'NaN']:
+            response = self.get('/events/nearby?latitude=55.75&longitude=37.61&afterId=1&afterScore=' + after_score, user)
+            self.assert400(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from app import app
+from app.cache import response_cache
+from app.ground.helper import paginate_grounds_by_grid_cell
+from app.models import Ground
+from app.tests.base import BaseTestCase
+
+GROUNDS = 30
+
+
+class TestGridCellPages(BaseTestCase):
+
+    def setUp(self):
+        super(TestGridCellPages, self).setUp()
+        for i in range(GROUNDS):
+            ground = Ground(i + 1, 'Ground', 'District', 'Address', None,
+                            False, False, False, False, False, False, False, 55.75 + i * 0.001, 37.61)
+            ground.save()
+
+    def test_pages_cover_all_grounds_in_distance_order(self):
+        per_page = app.config['GROUNDS_PER_PAGE']
+        page_count = -(-GROUNDS // per_page)
+
+        ids, distances = [], []
+        for page in range(1, page_count + 2):
+            pagination = paginate_grounds_by_grid_cell(page, 55.75, 37.61)
+            self.assertEqual(pagination.total, GROUNDS)
+            ids.extend(map(lambda g: g.id, pagination.items))
+            distances.extend(map(lambda g: g.distance, pagination.items))
+
+        self.assertEqual(sorted(ids), sorted(map(lambda g: g.id, Ground.query.all())))
+        self.assertEqual(distances, sorted(distances))
+
+    def test_only_the_first_pages_are_cached(self):
+        cached_count = app.config['GROUNDS_GRID_CACHED_PAGES'] * app.config['GROUNDS_PER_PAGE']
+        self.assertLess(cached_count, GROUNDS)
+
+        paginate_grounds_by_grid_cell(1, 55.75, 37.61)
+        paginate_grounds_by_grid_cell(7, 55.75, 37.61)
+
+        entries = [value for key, (_, value) in response_cache.entries.items() if key[0] == 'grounds.grid']
+        self.assertEqual(len(entries), 1)
+        ground_ids, total = entries[0]
+        self.assertEqual(len(ground_ids), cached_count)
+        self.assertEqual(total, GROUNDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from app import app
+from app.auth.limiter import client_address, UnknownEmails
+from app.tests.base import BaseTestCase
+
+
+class TestClientAddress(BaseTestCase):
+
+    def address(self, forwarded_for=None, proxy_count=1):
+        headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+        proxy_count, app.config['TRUSTED_PROXY_COUNT'] = app.config['TRUSTED_PROXY_COUNT'], proxy_count
+        try:
+            with app.test_request_context(headers=headers, environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+                return client_address()
+        finally:
+            app.config['TRUSTED_PROXY_COUNT'] = proxy_count
+
+    def test_address_appended_by_the_proxy(self):
+        self.assertEqual(self.address('203.0.113.7'), '203.0.113.7')
+
+    def test_forged_entries_are_ignored(self):
+        self.assertEqual(self.address('1.2.3.4, 203.0.113.7'), '203.0.113.7')
+        self.assertEqual(self.address('1.2.3.4, 203.0.113.7, 10.0.0.2', proxy_count=2), '203.0.113.7')
+
+    def test_without_proxies(self):
+        self.assertEqual(self.address(), '10.0.0.1')
+        self.assertEqual(self.address('203.0.113.7', proxy_count=0), '10.0.0.1')
+        self.assertEqual(self.address('203.0.113.7', proxy_count=2), '10.0.0.1')
+
+
+class TestUnknownEmails(BaseTestCase):
+
+    def test_registration_clears_other_workers(self):
+        # two instances sharing the login_buckets table stand in for two workers
+        worker, other_worker = UnknownEmails(60, shared=True), UnknownEmails(60, shared=True)
+
+        worker.add('new@test.com')
+        self.assertIn('new@test.com', other_worker)
+        self.assertNotIn('other@test.com', other_worker)
+
+        other_worker.discard('new@test.com')
+        self.assertNotIn('new@test.com', worker)
+
+    def test_entries_expire(self):
+        for shared in [False, True]:
+            unknown_emails = UnknownEmails(0, shared=shared)
+            unknown_emails.add('new@test.com')
+            self.assertNotIn('new@test.com', unknown_emails)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from sqlalchemy import exc
+from app import app, db, sockets
+from app.event.buffer import message_buffer
+from app.models import EventMessage
+from app.tests.base import BaseTestCase
+
+NAMESPACE = '/event/messages'
+
+
+class TestMessageBuffer(BaseTestCase):
+
+    def setUp(self):
+        super(TestMessageBuffer, self).setUp()
+        # ids preallocated from the sequence of a previous test
+        message_buffer.ids = []
+        message_buffer.pending = []
+
+    def tearDown(self):
+        message_buffer.pending = []
+        super(TestMessageBuffer, self).tearDown()
+
+    def append(self, user, event_id, text):
+        return message_buffer.append(EventMessage(user.id, text, event_id))
+
+    def stored_ids(self):
+        return sorted(map(lambda r: r[0], db.session.query(EventMessage.id).all()))
+
+    def test_bad_rows_are_dropped(self):
+        user = self.create_user()
+        event = self.create_training(user, self.create_ground())
+
+        first = self.append(user, event.id, 'first')
+        orphan = self.append(user, event.id + 1, 'orphan')
+        last = self.append(user, event.id, 'last')
+
+        self.assertEqual(message_buffer.flush(), 2)
+        self.assertEqual(message_buffer.pending, [])
+        self.assertEqual(self.stored_ids(), [first.id, last.id])
+        self.assertNotIn(orphan.id, self.stored_ids())
+
+    def test_connection_errors_are_retried(self):
+        user = self.create_user()
+        event = self.create_training(user, self.create_ground())
+        message = self.append(user, event.id, 'text')
+
+        error = exc.OperationalError('INSERT', {}, Exception('connection closed'))
+        with mock.patch.object(message_buffer, '_insert', side_effect=error):
+            self.assertEqual(message_buffer.flush(), 0)
+        self.assertEqual(len(message_buffer.pending), 1)
+
+        self.assertEqual(message_buffer.flush(), 1)
+        self.assertEqual(self.stored_ids(), [message.id])
+
+
+class TestSocketMessages(BaseTestCase):
+
+    def setUp(self):
+        super(TestSocketMessages, self).setUp()
+        message_buffer.ids = []
+        message_buffer.pending = []
+
+        self.user = self.create_user()
+        self.event = self.create_training(self.user, self.create_ground())
+
+        token = self.user.encode_auth_token(self.user.id).decode('utf-8')
+        self.socket = sockets.test_client(app, namespace=NAMESPACE, query_string='?token=' + token)
+        self.socket.emit('join', {'eventId': self.event.id}, namespace=NAMESPACE)
+        self.socket.get_received(NAMESPACE)
+
+    def tearDown(self):
+        self.socket.disconnect(namespace=NAMESPACE)
+        message_buffer.pending = []
+        super(TestSocketMessages, self).tearDown()
+
+    def send(self, text):
+        self.socket.emit('message', {'eventId': self.event.id, 'message': text}, namespace=NAMESPACE)
+        # the test client passes the data of 'message' events without wrapping it in a list
+        return [r['args'] for r in self.socket.get_received(NAMESPACE) if r['name'] == 'message']
+
+    def test_message_is_broadcast(self):
+        received = self.send('text')
+        self.assertEqual(received[0]['status'], 'success')
+        self.assertEqual(len(message_buffer.pending), 1)
+
+    def test_invalid_text_is_rejected(self):
+        for text in ['te\x00xt', 'x' * (app.config['MESSAGES_MAX_LENGTH'] + 1), 1]:
+            received = self.send(text)
+            self.assertEqual(received[0]['status'], 'failed')
+        self.assertEqual(message_buffer.pending, [])
+
+    def test_history_skips_the_message_queue(self):
+        # a page of the longest messages is over the PostgreSQL NOTIFY limit
+        for i in range(app.config['MESSAGES_PER_PAGE']):
+            self.send('\U0001F600' * app.config['MESSAGES_MAX_LENGTH'])
+
+        manager = sockets.server.manager
+        with mock.patch.object(manager, 'emit', wraps=manager.emit) as emit:
+            self.socket.emit('join', {'eventId': self.event.id}, namespace=NAMESPACE)
+
+        calls = [c for c in emit.call_args_list if c[0][0] == 'history']
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(calls[0][1].get('ignore_queue'))
+
+        history = [r['args'][0] for r in self.socket.get_received(NAMESPACE) if r['name'] == 'history']
+        self.assertEqual(len(history[0]['messages']), app.config['MESSAGES_PER_PAGE'])
+
+
+class TestMessagesSync(BaseTestCase):
+
+    def setUp(self):
+        super(TestMessagesSync, self).setUp()
+        self.user = self.create_user()
+        self.event = self.create_training(self.user, self.create_ground())
+
+    def create_messages(self, count, age):
+        begin = datetime.utcnow() - age
+        messages = []
+        for i in range(count):
+            message = EventMessage(self.user.id, 'message %d' % i, self.event.id)
+            message.create_at = begin + timedelta(milliseconds=i)
+            messages.append(message)
+        db.session.add_all(messages)
+        db.session.commit()
+        return list(map(lambda m: m.id, messages))
+
+    def sync(self, since, count=10):
+        return self.get('/events/%d/messages?since=%s&count=%d' % (self.event.id, since, count), self.user)
+
+    def test_unknown_since_id(self):
+        self.create_messages(3, timedelta(minutes=1))
+        self.assert400(self.sync('100000'))
+        self.assert400(self.sync('yesterday'))
+
+    def test_next_page_starts_at_the_high_water_mark(self):
+        ids = self.create_messages(15, timedelta(minutes=1))
+
+        response = self.sync(ids[0])
+        self.assert200(response)
+        self.assertEqual([m['id'] for m in response.json['messages']], ids[1:11])
+        self.assertEqual(response.json['highWaterMark'], str(ids[10]))
+        self.assertIn('since=%d' % ids[10], response.json['next'])
+
+        response = self.sync(response.json['highWaterMark'])
+        self.assertEqual([m['id'] for m in response.json['messages']], ids[11:])
+        self.assertIsNone(response.json['next'])
+
+    def test_no_next_page_past_unsettled_messages(self):
+        ids = self.create_messages(3, timedelta(minutes=1))
+        self.create_messages(12, timedelta(0))
+
+        response = self.sync(ids[0])
+        self.assert200(response)
+        self.assertEqual(len(response.json['messages']), 10)
+        self.assertEqual(response.json['highWaterMark'], str(ids[2]))
+        self.assertIsNone(response.json['next'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import pickle
+import threading
+import time
+import unittest
+import uuid
+from app.pg_manager import PostgresManager, NOTIFY_PAYLOAD_MAX_BYTES
+
+DATABASE_URL = os.getenv('DATABASE_TEST_URL')
+
+
+@unittest.skipUnless(DATABASE_URL, 'DATABASE_TEST_URL is not set')
+class TestPostgresManager(unittest.TestCase):
+    """
+    Publish through one manager and read the raw messages from the listener of another one.
+    """
+
+    def setUp(self):
+        channel = 'test-%s' % uuid.uuid4().hex
+        self.publisher = PostgresManager(DATABASE_URL, channel=channel)
+        self.listener = PostgresManager(DATABASE_URL, channel=channel)
+        self.messages = []
+
+        thread = threading.Thread(target=self.listen, daemon=True)
+        thread.start()
+
+        # publish until the listener has subscribed and got one message back
+        deadline = time.time() + 5
+        while not self.messages and time.time() < deadline:
+            self.publisher._publish({'method': 'ping'})
+            time.sleep(0.1)
+        self.assertTrue(self.messages, 'listener did not subscribe')
+
+    def tearDown(self):
+        self.publisher._close_publish_connection()
+
+    def listen(self):
+        for message in self.listener._listen():
+            self.messages.append(message)
+
+    def wait_for(self, method):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            for message in self.messages:
+                data = pickle.loads(message)
+                if data['method'] == method:
+                    return data
+            time.sleep(0.05)
+        self.fail('%s message was not received' % method)
+
+    def test_large_message_is_delivered(self):
+        # emoji take four bytes each, the pickled message ends up well over the NOTIFY limit
+        text = '\U0001F600' * 2000 * 3
+        self.publisher._publish({'method': 'emit', 'data': text})
+
+        data = self.wait_for('emit')
+        self.assertEqual(data['data'], text)
+        self.assertGreater(len(text.encode('utf-8')), NOTIFY_PAYLOAD_MAX_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import threading
+import unittest
+from sqlalchemy import func
+from app import app, db
+from app.models import Team, team_participants_table
+from app.tests.base import BaseTestCase
+
+JOINING_USERS = 12
+
+
+class TestConcurrentJoins(BaseTestCase):
+    """
+    Join a nearly full team from several threads at once, each with its own session
+    and connection, and check that the team isn't overfilled.
+    """
+
+    def join_at_once(self, event, users):
+        headers = [self.auth_headers(user) for user in users]
+        barrier = threading.Barrier(len(users))
+        statuses = [None] * len(users)
+
+        def join(i):
+            client = app.test_client()
+            barrier.wait()
+            try:
+                statuses[i] = client.post('/events/%d/actions/join' % event.id, headers=headers[i]).status_code
+            finally:
+                db.session.remove()
+
+        threads = [threading.Thread(target=join, args=(i,)) for i in range(len(users))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        db.session.remove()
+        return statuses
+
+    def participants(self, team_id):
+        team = Team.query.get(team_id)
+        rows = db.session.query(func.count()).select_from(team_participants_table) \
+            .filter(team_participants_table.c.team_id == team_id).scalar()
+        return team.participant_count, team.max_participants, rows
+
+    def test_parallel_joins_do_not_overfill_the_team(self):
+        owner = self.create_user('owner@test.com')
+        event = self.create_training(owner, self.create_ground(), max_participants=4)
+        team_id = event.teams[0].id
+        users = [self.create_user('user%d@test.com' % i) for i in range(JOINING_USERS)]
+
+        statuses = self.join_at_once(event, users)
+
+        participant_count, max_participants, rows = self.participants(team_id)
+        self.assertLessEqual(participant_count, max_participants)
+        self.assertEqual(participant_count, rows)
+        self.assertEqual(participant_count, max_participants)
+        self.assertEqual(statuses.count(201), max_participants - 1)
+        self.assertEqual(statuses.count(400), JOINING_USERS - max_participants + 1)
+
+    def test_parallel_joins_of_one_user(self):
+        owner = self.create_user('owner@test.com')
+        event = self.create_training(owner, self.create_ground(), max_participants=4)
+        team_id = event.teams[0].id
+        user = self.create_user('user@test.com')
+
+        statuses = self.join_at_once(event, [user] * 4)
+
+        participant_count, max_participants, rows = self.participants(team_id)
+        self.assertEqual(participant_count, 2)
+        self.assertEqual(rows, 2)
+        self.assertEqual(statuses.count(201), 1)
+
+
+class TestTeamsOfUser(BaseTestCase):
+
+    def test_teams_are_paginated_newest_first(self):
+        user = self.create_user('user@test.com')
+        other = self.create_user('other@test.com')
+        ground = self.create_ground()
+        team_ids = [self.create_training(user, ground).teams[0].id for _ in range(6)]
+        self.create_training(other, ground)
+
+        per_page = app.config['TEAMS_PER_PAGE']
+        team_ids.reverse()
+
+        response = self.get('/teams', user)
+        self.assert200(response)
+        self.assertEqual(response.json['count'], len(team_ids))
+        self.assertEqual([t['id'] for t in response.json['teams']], team_ids[:per_page])
+        self.assertIsNone(response.json['previous'])
+        self.assertIsNotNone(response.json['next'])
+
+        response = self.get('/teams?page=2', user)
+        self.assertEqual([t['id'] for t in response.json['teams']], team_ids[per_page:2 * per_page])
+        self.assertIsNotNone(response.json['previous'])
+        self.assertIsNone(response.json['next'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,31 @@
+import datetime
 import os
+import uuid
 from hashlib import md5
+from io import BytesIO
 from base64 import decodebytes, b64decode
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from eventlet import tpool
+from eventlet.patcher import is_monkey_patched
 from flask import make_response, jsonify, url_for
-from app import app, db, s3
+from werkzeug.exceptions import RequestEntityTooLarge
+from PIL import Image, ImageOps
+from sqlalchemy import and_
+from app import app, app_sheduler, db, s3
 from app.models import User
 
 ALLOWED_EXTENSIONS = set(['pdf', 'png', 'jpg', 'jpeg'])
+IMAGE_CONTENT_TYPES = {'image/png': 'png', 'image/jpeg': 'jpg'}
+EXTENSION_CONTENT_TYPES = {'pdf': 'application/pdf', 'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg'}
 BUCKET_NAME = os.getenv('BUCKETEER_BUCKET_NAME')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Avatar keys are derived from the file content, so their objects never change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+AVATAR_THUMBNAILS_JOB_ID = 'avatar_thumbnails_%s'
+
+# Parts of multipart uploads are sent to the bucket in the background
+upload_executor = ThreadPoolExecutor(max_workers=app.config['UPLOAD_THREADS'])
 
 def response(status, message, code):
     """
@@ -30,24 +49,214 @@ def file_extension(filename):
 
     return filename.rsplit('.', 1)[1].lower()
 
-def secure_filename(user, filename):
-    exten = file_extension(filename)
-    if not exten:
-        raise ValueError('Wrong format of filename')
+def avatar_filename(digest, extension):
+    return 'avatars/%s.%s' % (digest, extension)
+
+def avatar_thumbnail_filename(digest, size):
+    return 'avatars/%s_%d.jpg' % (digest, size)
+
+def upload_file(filename, data, content_type=None, cache_control=None):
+    options = {}
+    if content_type:
+        options['ContentType'] = content_type
+    if cache_control:
+        options['CacheControl'] = cache_control
+
+    try:
+        s3.put_object(ACL='public-read', Body=data, Bucket=BUCKET_NAME, Key=filename, **options)
+    except Exception as e:
+        raise ValueError(e)
+
+    return file_url(filename)
+
+def upload_avatar(filedata, extension):
+    """
+    Upload a base64 encoded user image under a key derived from its content.
+    :param filedata: Base64 encoded image
+    :param extension: Image file extension
+    :return: Image url and hex MD5 digest of the image
+    """
+    try:
+        data = b64decode(filedata)
+    except Exception as e:
+        raise ValueError(e)
+
+    digest = md5(data).hexdigest()
+    image_url = upload_file(avatar_filename(digest, extension), data, EXTENSION_CONTENT_TYPES.get(extension),
+                            IMMUTABLE_CACHE_CONTROL)
+    return image_url, digest
+
+def upload_avatar_stream(stream, content_type, max_length):
+    """
+    Stream a user image to a temporary key, then copy it to the key derived from its content.
+    :param stream: Readable stream of the image
+    :param content_type: Image content type
+    :param max_length: Maximum image size in bytes
+    :return: Image url and hex MD5 digest of the image
+    """
+    extension = IMAGE_CONTENT_TYPES[content_type]
+    upload_filename = 'avatars/uploads/%s.%s' % (uuid.uuid4().hex, extension)
+
+    _, digest = upload_stream(upload_filename, stream, content_type, max_length)
+    filename = avatar_filename(digest, extension)
+
+    try:
+        s3.copy_object(ACL='public-read', Bucket=BUCKET_NAME, Key=filename,
+                       CopySource={'Bucket': BUCKET_NAME, 'Key': upload_filename},
+                       ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL, MetadataDirective='REPLACE')
+    except Exception as e:
+        raise ValueError(e)
+    finally:
+        try:
+            s3.delete_object(Bucket=BUCKET_NAME, Key=upload_filename)
+        except Exception:
+            pass
+
+    return file_url(filename), digest
+
+def schedule_avatar_thumbnails(user_id, digest, extension):
+    """
+    Generate the thumbnails of a user image in the background.
+    :param user_id: User Id
+    :param digest: Hex MD5 digest of the image
+    :param extension: Image file extension
+    """
+    app_sheduler.add_job(func=generate_avatar_thumbnails, args=[user_id, digest, extension],
+                         id=AVATAR_THUMBNAILS_JOB_ID % user_id, misfire_grace_time=60, replace_existing=True)
+
+def render_avatar_thumbnails(original, sizes):
+    """
+    Crop and scale an image to square JPEG thumbnails.
+    :param original: Image file content
+    :param sizes: Thumbnail sides in pixels
+    :return: Dict of sizes and JPEG data
+    """
+    image = Image.open(BytesIO(original))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+
+    thumbnails = {}
+    for size in sizes:
+        data = BytesIO()
+        ImageOps.fit(image, (size, size), Image.LANCZOS).save(data, 'JPEG', quality=85)
+        thumbnails[size] = data.getvalue()
+    return thumbnails
+
+def generate_avatar_thumbnails(user_id, digest, extension):
+    """
+    Store square JPEG thumbnails of a user image for every configured size and
+    save their urls to the user, unless the user image has changed meanwhile.
+    :param user_id: User Id
+    :param digest: Hex MD5 digest of the image
+    :param extension: Image file extension
+    """
+    filename = avatar_filename(digest, extension)
+    original = s3.get_object(Bucket=BUCKET_NAME, Key=filename)['Body'].read()
+
+    # scheduler jobs are green threads under eventlet, decoding and resizing would block the hub
+    sizes = app.config['AVATAR_THUMBNAIL_SIZES']
+    if is_monkey_patched('thread'):
+        images = tpool.execute(render_avatar_thumbnails, original, sizes)
+    else:
+        images = render_avatar_thumbnails(original, sizes)
+
+    thumbnails = {}
+    for size, data in images.items():
+        thumbnails[str(size)] = upload_file(avatar_thumbnail_filename(digest, size), data, 'image/jpeg',
+                                            IMMUTABLE_CACHE_CONTROL)
+
+    with db.engine.begin() as connection:
+        connection.execute(User.__table__.update()
+                           .where(and_(User.id == user_id, User.image_url == file_url(filename)))
+                           .values(image_thumbnails=thumbnails, modified_at=datetime.datetime.utcnow()))
 
-    user_identifier = ''.join([user.name, user.surname, str(user.id)])
-    extension = '.' + exten
-    secure_filename = md5(user_identifier.encode()).hexdigest() + extension
+def file_url(filename):
+    endpoint_url = app.config.get('S3_ENDPOINT_URL')
+    if endpoint_url:
+        return '%s/%s/%s' % (endpoint_url.rstrip('/'), BUCKET_NAME, filename)
 
-    return secure_filename
+    return 'https://%s.s3.amazonaws.com/%s' % (BUCKET_NAME, filename)
+
+def upload_stream(filename, stream, content_type, max_length):
+    """
+    Upload a file read from the stream in chunks, computing its MD5 on the way.
+    Files larger than one part are sent with an S3 multipart upload, the parts
+    are uploaded on the upload thread pool while the next part is read.
+    :param filename: Bucket key
+    :param stream: Readable stream of the file
+    :param content_type: Content type of the file
+    :param max_length: Maximum file size in bytes, RequestEntityTooLarge is raised past it
+    :return: File url and hex MD5 digest of the file
+    """
+    part_size = app.config['UPLOAD_PART_SIZE']
+    max_parts_in_flight = app.config['UPLOAD_THREADS']
 
-def upload_file(filename, filedata):
-    bin_data = b64decode(filedata)
+    digest = md5()
+    length = 0
+    part = bytearray()
+    upload_id = None
+    futures = []
 
     try:
-        s3.put_object(ACL='public-read', Body=bin_data, Bucket=BUCKET_NAME, Key=filename)
+        while True:
+            chunk = stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            length += len(chunk)
+            if length > max_length:
+                raise RequestEntityTooLarge()
+
+            digest.update(chunk)
+            part += chunk
+
+            if len(part) >= part_size:
+                if upload_id is None:
+                    upload_id = s3.create_multipart_upload(ACL='public-read', Bucket=BUCKET_NAME, Key=filename,
+                                                           ContentType=content_type)['UploadId']
+
+                futures.append(upload_executor.submit(upload_part, filename, upload_id, len(futures) + 1, bytes(part)))
+                part = bytearray()
+
+                # bound the memory held by the parts being uploaded
+                pending = [f for f in futures if not f.done()]
+                if len(pending) >= max_parts_in_flight:
+                    wait(pending, return_when=FIRST_COMPLETED)
+
+        if not length:
+            raise ValueError('Empty file')
+
+        if upload_id is None:
+            s3.put_object(ACL='public-read', Body=bytes(part), Bucket=BUCKET_NAME, Key=filename,
+                          ContentType=content_type)
+        else:
+            if part:
+                futures.append(upload_executor.submit(upload_part, filename, upload_id, len(futures) + 1, bytes(part)))
+
+            parts = [f.result() for f in futures]
+            s3.complete_multipart_upload(Bucket=BUCKET_NAME, Key=filename, UploadId=upload_id,
+                                         MultipartUpload={'Parts': parts})
+    except (RequestEntityTooLarge, ValueError):
+        abort_multipart_upload(filename, upload_id, futures)
+        raise
     except Exception as e:
+        abort_multipart_upload(filename, upload_id, futures)
         raise ValueError(e)
 
-    file_url = 'https://%s.s3.amazonaws.com/%s' % (BUCKET_NAME, filename)
-    return file_url
\ No newline at end of file
+    return file_url(filename), digest.hexdigest()
+
+def upload_part(filename, upload_id, part_number, data):
+    result = s3.upload_part(Body=data, Bucket=BUCKET_NAME, Key=filename, UploadId=upload_id, PartNumber=part_number)
+    return {'ETag': result['ETag'], 'PartNumber': part_number}
+
+def abort_multipart_upload(filename, upload_id, futures):
+    if upload_id is None:
+        return
+
+    for future in futures:
+        future.cancel()
+    wait(futures)
+
+    try:
+        s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=filename, UploadId=upload_id)
+    except Exception:
+        pass
\ No newline at end of file
@@ -2,10 +2,9 @@ import os
 import requests
 from flask import make_response, jsonify, url_for
 from flask_sqlalchemy import BaseQuery
-from sqlalchemy import func, or_
-from sqlalchemy.orm import aliased
+from sqlalchemy import func, or_, select
 from app import app, db
-from app.models import User, Team
+from app.models import User, team_participants_table, teammate_counts_table
 
 def response(status, message, code):
     return make_response(jsonify({
@@ -35,10 +34,14 @@ def response_for_rated_user(user, by_user, status_code):
     })), status_code
 
 
-def get_user_json_list(users):
+def get_user_json_list(users, other_user=None):
+    rated_user_ids = None
+    if other_user:
+        rated_user_ids = User.rated_user_ids(other_user, map(lambda u: u.id, users))
+
     json_list = []
     for user in users:
-        json_list.append(user.json())
+        json_list.append(user.json(other_user, rated_user_ids))
     return json_list
 
 
@@ -50,19 +53,34 @@ def response_for_user_teammates(users):
 
 
 def get_teammates(user, count):
-    target = aliased(User)
-    teammate = aliased(User)
-    ta_team = aliased(Team)
-    te_team = aliased(Team)
-    teammates_query = db.session.query(target, teammate, func.count(teammate.id)) \
-        .join((ta_team, target.teams)) \
-        .join((te_team, teammate.teams)) \
-        .filter(ta_team.id == te_team.id) \
-        .filter(target.id != teammate.id) \
-        .filter(target.id == user.id) \
-        .group_by(target.id, teammate.id) \
-        .order_by(func.count(teammate.id).desc()) \
-        .limit(count)
-
-    items = list(map(lambda i: i[1], teammates_query.all()))
-    return items
\ No newline at end of file
+    """
+    Top teammates of the user by shared teams, read from the maintained teammate_counts
+    table with an index scan on (user_id, shared_teams DESC).
+    :param user: User
+    :param count: Teammates count
+    :return:
+    """
+    return User.query \
+        .join(teammate_counts_table, teammate_counts_table.c.teammate_id == User.id) \
+        .filter(teammate_counts_table.c.user_id == user.id) \
+        .order_by(teammate_counts_table.c.shared_teams.desc()) \
+        .limit(count) \
+        .all()
+
+
+def rebuild_teammate_counts():
+    """
+    Recompute teammate_counts from teamparticipants.
+    :return:
+    """
+    target = team_participants_table.alias('target')
+    teammate = team_participants_table.alias('teammate')
+    shared_teams_query = select([target.c.paricipant_id, teammate.c.paricipant_id, func.count()]) \
+        .select_from(target.join(teammate, target.c.team_id == teammate.c.team_id)) \
+        .where(target.c.paricipant_id != teammate.c.paricipant_id) \
+        .group_by(target.c.paricipant_id, teammate.c.paricipant_id)
+
+    db.session.execute(teammate_counts_table.delete())
+    db.session.execute(teammate_counts_table.insert()
+        .from_select(['user_id', 'teammate_id', 'shared_teams'], shared_teams_query))
+    db.session.commit()
@@ -1,9 +1,11 @@
-from werkzeug.utils import secure_filename
 from flask import Blueprint, request, abort, url_for, redirect
 from app.auth.helper import token_required
+from app.database import read_replica
 from app.user.helper import response, response_for_user, response_for_user_personal, response_for_rated_user, response_for_user_teammates, \
     get_user_json_list, get_teammates
-from app.uploads.helper import upload_file, allowed_file, secure_filename
+from app import app
+from app.uploads.helper import upload_avatar, upload_avatar_stream, schedule_avatar_thumbnails, allowed_file, \
+    file_extension, IMAGE_CONTENT_TYPES
 from app.models import User
 
 # Initialize blueprint
@@ -32,21 +34,50 @@ def edit_user(current_user):
     if not allowed_file(image_name):
         return response('failed', 'Wrong image format', 400)
 
-    print("------------ LOADING")
-    
     user = User.get_by_id(current_user.id)
 
+    extension = file_extension(image_name)
+
     try:
-        secure_name = secure_filename(user, image_name)
-        image_url = upload_file(secure_name, image_data)
+        image_url, digest = upload_avatar(image_data, extension)
     except ValueError:
         return response('failed', 'Wrong image format', 400)
 
     user.update(image_url)
+    schedule_avatar_thumbnails(user.id, digest, extension)
     return response_for_user(user, User.get_by_id(current_user.id))
 
 
+@user.route('/user/avatar', methods=['PUT'])
+@token_required
+def upload_user_image(current_user):
+    """
+    Upload the user image sent as the raw request body, streaming it to the bucket.
+    :param current_user: User
+    :return:
+    """
+    extension = IMAGE_CONTENT_TYPES.get(request.mimetype)
+    if not extension:
+        return response('failed', 'Wrong image format', 400)
+
+    max_length = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length and request.content_length > max_length:
+        abort(413)
+
+    user = User.get_by_id(current_user.id)
+
+    try:
+        image_url, digest = upload_avatar_stream(request.stream, request.mimetype, max_length)
+    except ValueError:
+        return response('failed', 'Image cannot be uploaded', 400)
+
+    user.update(image_url)
+    schedule_avatar_thumbnails(user.id, digest, extension)
+    return response_for_user_personal(user)
+
+
 @user.route('/users/<user_id>', methods=['GET'])
+@read_replica
 @token_required
 def get_user(current_user, user_id):
     try:
@@ -64,6 +95,7 @@ def get_user(current_user, user_id):
 
 
 @user.route('/users/<user_id>/teammates', methods=['GET'])
+@read_replica
 @token_required
 def get_user_teammates(current_user, user_id):
     try:
@@ -78,7 +110,7 @@ def get_user_teammates(current_user, user_id):
             items = get_teammates(user, count)
 
             if items:
-                return response_for_user_teammates(get_user_json_list(items))
+                return response_for_user_teammates(get_user_json_list(items, current_user))
             return response_for_user_teammates([])
         return response('failed', "User not found", 404)
 
@@ -99,11 +131,9 @@ def rate_user(current_user, user_id):
             return response('failed', "User not found", 404)
 
         user = User.get_by_id(current_user.id)
-        if user_to_rate.rated_by_user(user):
+        if not user_to_rate.rate(user):
             return response('failed', 'User already rated', 400)
 
-        user_to_rate.rated_me_users.append(user)
-        user_to_rate.update()
         return response_for_rated_user(user_to_rate, user, 201)
         
 
@@ -123,11 +153,9 @@ def unrate_user(current_user, user_id):
             return response('failed', "User not found", 404)
 
         user = User.get_by_id(current_user.id)
-        if not user_to_unrate.rated_by_user(user):
+        if not user_to_unrate.unrate(user):
             return response('failed', 'User not rated to be unrated', 400)
 
-        user_to_unrate.rated_me_users.remove(user)
-        user_to_unrate.update()
         return response_for_rated_user(user_to_unrate, user, 201)
 
 
@@ -1,5 +1,47 @@
 from app import app
 from app.ground.helper import response
+from app.conditional import add_body_etag
+from app.profiling import begin_request_profile, finish_request_profile
+from app.metrics.helper import observe_request
+
+
+@app.before_request
+def profile_request():
+    """
+    Start counting the queries of the request.
+    """
+    begin_request_profile()
+
+
+@app.after_request
+def conditional_response(response):
+    """
+    Let clients revalidate any JSON GET response with its ETag.
+    :param response: Http Response
+    :return: Http Response
+    """
+    return add_body_etag(response)
+
+
+@app.after_request
+def profiled_response(response):
+    """
+    Report the queries and database time of the request.
+    :param response: Http Response
+    :return: Http Response
+    """
+    return finish_request_profile(response)
+
+
+@app.after_request
+def measured_response(response):
+    """
+    Record the request in the metrics.
+    :param response: Http Response
+    :return: Http Response
+    """
+    return observe_request(response)
+
 
 @app.errorhandler(404)
 def route_not_found(e):
@@ -0,0 +1,346 @@
+import json
+import math
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from timeit import default_timer
+
+import forgery_py as faker
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from app import app, db, sockets
+from app.event.buffer import message_buffer
+from app.hashing import password_hasher
+from app.models import User, Ground, GroundActivity, Event, EventMessage, Activity, EventParticipantsLevel
+from app.user.helper import rebuild_teammate_counts
+
+SEED_PASSWORD = 'benchmark'
+SEED_EMAIL_DOMAIN = 'seed.example.com'
+# source ids of seeded grounds, far from the ids of the grounds dataset
+SEED_SOURCE_ID_BASE = 1000000000
+SEED_BATCH_SIZE = 1000
+
+# Moscow, where the grounds dataset comes from
+LATITUDE_RANGE = (55.55, 55.92)
+LONGITUDE_RANGE = (37.35, 37.85)
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def insert_rows(table, rows):
+    """
+    Insert rows with multi-row inserts.
+    :param table: Table
+    :param rows: List of dicts
+    :return: Ids of the inserted rows
+    """
+    ids = []
+    for i in range(0, len(rows), SEED_BATCH_SIZE):
+        result = db.session.execute(table.insert().values(rows[i:i + SEED_BATCH_SIZE]).returning(table.c.id))
+        ids.extend(map(lambda r: r[0], result))
+    db.session.commit()
+    return ids
+
+
+def seed_users(count):
+    # one hash for all the users, hashing each password would dominate the seed time
+    password = password_hasher.generate_password_hash(SEED_PASSWORD)
+    run = int(time.time())
+    now = datetime.utcnow()
+
+    return insert_rows(User.__table__, [{
+        'email': 'user%d.%d@%s' % (run, i, SEED_EMAIL_DOMAIN),
+        'password': password,
+        'name': faker.name.first_name(),
+        'surname': faker.name.last_name(),
+        'birthday': datetime.combine(faker.date.date(past=True, min_delta=16 * 365, max_delta=50 * 365), datetime.min.time()),
+        'rating': 0,
+        'registered_on': now,
+        'modified_at': now
+    } for i in range(count)])
+
+
+def seed_grounds(count):
+    first_source_id = max(db.session.query(func.max(Ground.source_id)).scalar() or 0, SEED_SOURCE_ID_BASE) + 1
+    now = datetime.utcnow()
+
+    ground_ids = insert_rows(Ground.__table__, [{
+        'source_id': first_source_id + i,
+        'name': faker.address.street_name(),
+        'district': faker.address.city(),
+        'address': faker.address.street_address(),
+        'website': None,
+        'hasMusic': random.random() < 0.2,
+        'hasWifi': random.random() < 0.3,
+        'hasToilet': random.random() < 0.5,
+        'hasEatery': random.random() < 0.3,
+        'hasDressingRoom': random.random() < 0.4,
+        'hasLighting': random.random() < 0.6,
+        'paid': random.random() < 0.3,
+        'latitude': random.uniform(*LATITUDE_RANGE),
+        'longitude': random.uniform(*LONGITUDE_RANGE),
+        'create_at': now,
+        'modified_at': now
+    } for i in range(count)])
+
+    activity_rows = []
+    for ground_id in ground_ids:
+        for activity in random.sample(list(Activity), random.randint(1, 3)):
+            activity_rows.append({'ground_id': ground_id, 'activity': activity})
+
+    for i in range(0, len(activity_rows), SEED_BATCH_SIZE):
+        db.session.execute(GroundActivity.__table__.insert().values(activity_rows[i:i + SEED_BATCH_SIZE]))
+    db.session.commit()
+
+    return ground_ids
+
+
+def seed_events(count, user_ids, ground_ids):
+    """
+    Create events with their teams through the models, with some participants besides the owner.
+    """
+    event_ids = []
+    for i in range(0, count, SEED_BATCH_SIZE):
+        batch_size = min(SEED_BATCH_SIZE, count - i)
+        users = User.query.filter(User.id.in_(random.sample(user_ids, min(len(user_ids), batch_size * 4)))).all()
+        grounds = Ground.query.filter(Ground.id.in_(random.sample(ground_ids, min(len(ground_ids), batch_size)))).all()
+
+        events = []
+        for _ in range(batch_size):
+            owner = random.choice(users)
+            begin_at = datetime.utcnow() + timedelta(hours=random.randint(-7 * 24, 14 * 24))
+            end_at = begin_at + timedelta(hours=random.randint(1, 3))
+            arguments = [owner, faker.lorem_ipsum.title(), faker.lorem_ipsum.sentence(), random.choice(list(Activity)),
+                         random.choice(list(EventParticipantsLevel)), 16, random.randint(25, 60), begin_at, end_at]
+
+            kind = random.random()
+            if kind < 0.6:
+                new_event = Event.init_training(*arguments, max_participants=random.randint(4, 20))
+            elif kind < 0.9:
+                new_event = Event.init_match(*arguments, teams_size=random.randint(3, 11))
+            else:
+                new_event = Event.init_tourney(*arguments, teams_size=random.randint(3, 6))
+            new_event.ground = random.choice(grounds)
+
+            participants = {owner.id}
+            for team in new_event.teams:
+                candidates = [u for u in users if u.id not in participants]
+                free_places = team.max_participants - team.participant_count
+                for user in random.sample(candidates, min(len(candidates), random.randint(0, free_places))):
+                    team.add_participant(user)
+                    participants.add(user.id)
+
+            events.append(new_event)
+
+        db.session.add_all(events)
+        db.session.commit()
+        event_ids.extend(map(lambda e: e.id, events))
+
+    return event_ids
+
+
+def seed_messages(count, user_ids, event_ids):
+    begin = datetime.utcnow() - timedelta(seconds=count)
+    return insert_rows(EventMessage.__table__, [{
+        'event_id': random.choice(event_ids),
+        'sender_id': random.choice(user_ids),
+        'text': faker.lorem_ipsum.sentence(),
+        'create_at': begin + timedelta(seconds=i)
+    } for i in range(count)])
+
+
+def seed(grounds, users, events, messages):
+    """
+    Fill the database with synthetic grounds, users, events with teams and chat messages.
+    Seeded users have the password SEED_PASSWORD.
+    :return: Dict of the counts of created rows
+    """
+    user_ids = seed_users(users) if users else []
+    ground_ids = seed_grounds(grounds) if grounds else []
+
+    event_ids = []
+    if events:
+        if not user_ids or not ground_ids:
+            raise ValueError('Events need seeded users and grounds')
+        event_ids = seed_events(events, user_ids, ground_ids)
+        rebuild_teammate_counts()
+
+    message_ids = []
+    if messages:
+        if not user_ids or not event_ids:
+            raise ValueError('Messages need seeded users and events')
+        message_ids = seed_messages(messages, user_ids, event_ids)
+
+    return {
+        'users': len(user_ids),
+        'grounds': len(ground_ids),
+        'events': len(event_ids),
+        'messages': len(message_ids)
+    }
+
+
+class QueryCounter(object):
+    """
+    Count the statements executed by every engine while active.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(Engine, 'before_cursor_execute', self)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    # nearest rank
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(p / 100.0 * len(ordered))), 1) - 1]
+
+
+def summarize(latencies, queries, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None
+    }
+
+
+def http_scenarios(events, teams_user):
+    """
+    Requests to benchmark, as names and functions returning the method, path and json body.
+    """
+    event_ids = list(map(lambda e: e.id, events))
+    ground_ids = list(set(map(lambda e: e.ground_id, events)))
+    owner_ids = list(set(map(lambda e: e.owner_id, events)))
+
+    def near():
+        return random.uniform(*LATITUDE_RANGE), random.uniform(*LONGITUDE_RANGE)
+
+    def geo():
+        latitude, longitude = near()
+        return 'POST', '/grounds/geo', {'geobounds': {
+            'northEast': {'latitude': latitude + 0.02, 'longitude': longitude + 0.03},
+            'southWest': {'latitude': latitude, 'longitude': longitude}
+        }}
+
+    return [
+        ('grounds', lambda: ('GET', '/grounds/?page=%d&latitude=%f&longitude=%f' % ((random.randint(1, 3),) + near()), None)),
+        ('grounds_geo', geo),
+        ('events', lambda: ('GET', '/events?page=%d' % random.randint(1, 3), None)),
+        ('events_ground', lambda: ('GET', '/events?groundId=%d' % random.choice(ground_ids), None)),
+        ('events_status', lambda: ('GET', '/events?status=%d' % random.randint(1, 4), None)),
+        ('events_type', lambda: ('GET', '/events?type=%d' % random.randint(1, 3), None)),
+        ('events_activity', lambda: ('GET', '/events?activity=%d' % random.choice(list(Activity)).value, None)),
+        ('events_owner', lambda: ('GET', '/events?ownerId=%d' % random.choice(owner_ids), None)),
+        ('events_participant', lambda: ('GET', '/events?participantId=%d' % random.choice(owner_ids), None)),
+        ('events_nearby', lambda: ('GET', '/events/nearby?latitude=%f&longitude=%f' % near(), None)),
+        ('event', lambda: ('GET', '/events/%d' % random.choice(event_ids), None)),
+        ('event_messages', lambda: ('GET', '/events/%d/messages' % random.choice(event_ids), None)),
+        ('teams', lambda: ('GET', '/teams', None)),
+        ('user_teammates', lambda: ('GET', '/users/%d/teammates' % teams_user.id, None)),
+    ]
+
+
+def run_http_scenario(client, headers, request_of, count):
+    latencies, queries, errors = [], [], 0
+
+    begin = default_timer()
+    for _ in range(count):
+        method, path, body = request_of()
+        started_at = default_timer()
+        response = client.open(path, method=method, headers=headers,
+                               data=json.dumps(body) if body is not None else None,
+                               content_type='application/json' if body is not None else None)
+        latencies.append(default_timer() - started_at)
+
+        if response.status_code >= 400:
+            errors += 1
+
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+    elapsed = default_timer() - begin
+
+    return summarize(latencies, queries, errors, elapsed)
+
+
+def run_chat_scenario(token, event_id, count):
+    """
+    Join an event chat with the SocketIO test client and send messages through it.
+    Queries are counted on the engines, including the write buffer flushes.
+    """
+    client = sockets.test_client(app, namespace='/event/messages', query_string='?token=' + token)
+    client.emit('join', {'eventId': event_id}, namespace='/event/messages')
+    client.get_received('/event/messages')
+
+    latencies, queries, errors = [], [], 0
+
+    begin = default_timer()
+    for i in range(count):
+        with QueryCounter() as counter:
+            started_at = default_timer()
+            client.emit('message', {'eventId': event_id, 'message': 'benchmark message %d' % i}, namespace='/event/messages')
+            received = client.get_received('/event/messages')
+            latencies.append(default_timer() - started_at)
+        queries.append(counter.count)
+
+        # the test client passes the data of 'message' events without wrapping it in a list
+        if not any(r['name'] == 'message' and r['args'].get('status') == 'success' for r in received):
+            errors += 1
+
+    with QueryCounter() as counter:
+        message_buffer.flush()
+    elapsed = default_timer() - begin
+    queries[-1] += counter.count
+
+    client.disconnect(namespace='/event/messages')
+    return summarize(latencies, queries, errors, elapsed)
+
+
+def run_benchmark(count, warmup):
+    """
+    Drive the hot endpoints through the Flask test client as a seeded user.
+    :param count: Measured requests per scenario
+    :param warmup: Unmeasured requests per scenario run first
+    :return: Dict with the results of every scenario
+    """
+    user = User.query.filter(User.email.like('%@' + SEED_EMAIL_DOMAIN)).order_by(User.id).first()
+    events = Event.query.filter(Event.owner_id.isnot(None), Event.ground_id.isnot(None)) \
+        .order_by(Event.id.desc()).limit(1000).all()
+    if not user or not events:
+        raise ValueError('Seed the database first')
+
+    token = user.encode_auth_token(user.id).decode('utf-8')
+    headers = {'Authorization': 'Bearer ' + token}
+    teams_user = User.get_by_id(events[0].owner_id)
+
+    results = {}
+    client = app.test_client()
+    for name, request_of in http_scenarios(events, teams_user):
+        if warmup:
+            run_http_scenario(client, headers, request_of, warmup)
+        results[name] = run_http_scenario(client, headers, request_of, count)
+
+    results['chat_messages'] = run_chat_scenario(token, events[0].id, count)
+
+    return {
+        'timestamp': datetime.utcnow().replace(microsecond=0).isoformat() + 'Z',
+        'requests_per_scenario': count,
+        'warmup_per_scenario': warmup,
+        'scenarios': results
+    }
@@ -1,13 +1,22 @@
 import coverage
+import json
 import os
+import threading
+import time
+import unittest
 import forgery_py as faker
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from app import app, db, models, app_sheduler
-from app.models import User, Activity
+from app.models import User, Activity, Event, EventMessage
 from app.ground.helper import update_grounds_dataset
+from app.user.helper import rebuild_teammate_counts
+from app.event.buffer import message_buffer
+from app.hashing import password_hasher
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+from timeit import default_timer
+from benchmark import seed as seed_database, run_benchmark
 
 # Initializing the manager
 manager = Manager(app)
@@ -18,10 +27,122 @@ migrate = Migrate(app, db)
 # Add the flask migrate
 manager.add_command('db', MigrateCommand)
     
+@manager.command
+def test():
+    """
+    Run the tests against the database of the testing configuration.
+    """
+    tests = unittest.TestLoader().discover('app/tests', pattern='test*.py')
+    result = unittest.TextTestRunner(verbosity=2).run(tests)
+    if result.wasSuccessful():
+        return 0
+    return 1
+
+@manager.command
+def scheduler():
+    """
+    Run the periodic jobs in this one process, for web workers started with SCHEDULE_PERIODIC_JOBS=0.
+    """
+    if not app.config['SCHEDULE_PERIODIC_JOBS']:
+        print('SCHEDULE_PERIODIC_JOBS is disabled for this process')
+        return 1
+
+    for job in app_sheduler.get_jobs():
+        print('Scheduled %s, next run at %s' % (job.id, job.next_run_time))
+
+    while True:
+        time.sleep(60)
+
 @manager.command
 def load_grounds():
     update_grounds_dataset()
 
+@manager.command
+def rebuild_teammates():
+    rebuild_teammate_counts()
+
+@manager.command
+def bench_messages(event_id, count=1000):
+    """
+    Measure chat messages stored per second by one worker, committing every
+    message like before and through the write-behind buffer.
+    The benchmark messages are removed afterwards.
+    """
+    event = Event.get_by_id(int(event_id))
+    if not event:
+        print('Event not found')
+        return
+
+    count = int(count)
+    sender_id = event.owner_id
+    ids = []
+
+    begin = default_timer()
+    for i in range(count):
+        message = EventMessage(sender_id, 'benchmark message %d' % i, event.id)
+        message.save()
+        ids.append(message.id)
+    synchronous_rate = count / (default_timer() - begin)
+
+    begin = default_timer()
+    for i in range(count):
+        ids.append(message_buffer.append(EventMessage(sender_id, 'benchmark message %d' % i, event.id)).id)
+    message_buffer.flush()
+    buffered_rate = count / (default_timer() - begin)
+
+    EventMessage.query.filter(EventMessage.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+    print('synchronous commit: %.1f messages/sec' % synchronous_rate)
+    print('write-behind buffer: %.1f messages/sec' % buffered_rate)
+
+@manager.command
+def bench_hashing(count=20):
+    """
+    Measure password checks per second by one worker, with all checks submitted at once.
+    """
+    count = int(count)
+    password_hash = password_hasher.generate_password_hash('benchmark password')
+
+    threads = [threading.Thread(target=password_hasher.check_password_hash, args=(password_hash, 'benchmark password'))
+               for _ in range(count)]
+    begin = default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = default_timer() - begin
+
+    print('password checks: %.1f/sec' % (count / elapsed))
+    print(password_hasher.stats())
+
+@manager.option('--grounds', dest='grounds', type=int, default=100)
+@manager.option('--users', dest='users', type=int, default=100)
+@manager.option('--events', dest='events', type=int, default=200)
+@manager.option('--messages', dest='messages', type=int, default=2000)
+def seed(grounds, users, events, messages):
+    """
+    Fill the database with synthetic grounds, users, events and chat messages.
+    Seeded users log in with the password 'benchmark'.
+    """
+    begin = default_timer()
+    counts = seed_database(grounds, users, events, messages)
+    print('seeded %s in %.1f sec' % (', '.join('%d %s' % (v, k) for k, v in sorted(counts.items())), default_timer() - begin))
+
+@manager.option('--requests', dest='count', type=int, default=200)
+@manager.option('--warmup', dest='warmup', type=int, default=20)
+@manager.option('--output', dest='output', default=None)
+def bench(count, warmup, output):
+    """
+    Benchmark the hot endpoints and the event chat on a seeded database, printing
+    p50/p95 latency, queries per request and throughput per scenario as JSON.
+    """
+    results = json.dumps(run_benchmark(count, warmup), indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(results + '\n')
+    print(results)
+
 @manager.command
 def dummy():
     # Create a user if they do not exist.
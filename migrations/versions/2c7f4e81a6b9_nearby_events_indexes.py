@@ -0,0 +1,26 @@
+"""indexes for nearby events
+
+Revision ID: 2c7f4e81a6b9
+Revises: f18b6c0e93d7
+Create Date: 2019-06-03 19:22:09.718350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7f4e81a6b9'
+down_revision = 'f18b6c0e93d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_grounds_latitude_longitude', 'grounds', ['latitude', 'longitude'], unique=False)
+    op.create_index('ix_events_ground_id_begin_at', 'events', ['ground_id', 'begin_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_events_ground_id_begin_at', table_name='events')
+    op.drop_index('ix_grounds_latitude_longitude', table_name='grounds')
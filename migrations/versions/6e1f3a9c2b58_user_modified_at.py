@@ -0,0 +1,28 @@
+"""users.modified_at and the teams tourney_id index
+
+Revision ID: 6e1f3a9c2b58
+Revises: c3e8b5f0a217
+Create Date: 2019-06-17 11:42:37.206518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1f3a9c2b58'
+down_revision = 'c3e8b5f0a217'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('modified_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE users SET modified_at = registered_on')
+    op.alter_column('users', 'modified_at', nullable=False)
+    op.create_index(op.f('ix_teams_tourney_id'), 'teams', ['tourney_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_teams_tourney_id'), table_name='teams')
+    op.drop_column('users', 'modified_at')
@@ -0,0 +1,31 @@
+"""backfill users.rating from userratings
+
+Revision ID: 8f2a61c4d9b0
+Revises: 3cde77c2297e
+Create Date: 2019-05-20 19:12:41.508311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a61c4d9b0'
+down_revision = '3cde77c2297e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # users.rating is maintained by User.rate/User.unrate from now on,
+    # so it has to start from the current number of ratings
+    op.execute(
+        'UPDATE users SET rating = ('
+        'SELECT count(*) FROM userratings WHERE userratings.rated_by_user_id = users.id'
+        ')'
+    )
+    op.alter_column('users', 'rating', server_default='0')
+
+
+def downgrade():
+    op.alter_column('users', 'rating', server_default=None)
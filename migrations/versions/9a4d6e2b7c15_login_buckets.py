@@ -0,0 +1,31 @@
+"""shared login rate limit buckets
+
+Revision ID: 9a4d6e2b7c15
+Revises: 2c7f4e81a6b9
+Create Date: 2019-06-05 12:41:37.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4d6e2b7c15'
+down_revision = '2c7f4e81a6b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_buckets',
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_login_buckets_updated_at'), 'login_buckets', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_login_buckets_updated_at'), table_name='login_buckets')
+    op.drop_table('login_buckets')
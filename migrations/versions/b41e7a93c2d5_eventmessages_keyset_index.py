@@ -0,0 +1,24 @@
+"""index eventmessages for keyset pagination
+
+Revision ID: b41e7a93c2d5
+Revises: 8f2a61c4d9b0
+Create Date: 2019-05-24 21:40:03.117925
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e7a93c2d5'
+down_revision = '8f2a61c4d9b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_eventmessages_event_id_create_at_id', 'eventmessages', ['event_id', 'create_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_eventmessages_event_id_create_at_id', table_name='eventmessages')
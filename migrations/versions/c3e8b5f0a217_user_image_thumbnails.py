@@ -0,0 +1,24 @@
+"""user image thumbnails
+
+Revision ID: c3e8b5f0a217
+Revises: 9a4d6e2b7c15
+Create Date: 2019-06-06 16:08:52.913406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8b5f0a217'
+down_revision = '9a4d6e2b7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('image_thumbnails', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'image_thumbnails')
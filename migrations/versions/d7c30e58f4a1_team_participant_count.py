@@ -0,0 +1,29 @@
+"""maintained teams.participant_count
+
+Revision ID: d7c30e58f4a1
+Revises: b41e7a93c2d5
+Create Date: 2019-05-27 18:05:52.640174
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7c30e58f4a1'
+down_revision = 'b41e7a93c2d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('teams', sa.Column('participant_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE teams SET participant_count = ('
+        'SELECT count(*) FROM teamparticipants WHERE teamparticipants.team_id = teams.id'
+        ')'
+    )
+
+
+def downgrade():
+    op.drop_column('teams', 'participant_count')
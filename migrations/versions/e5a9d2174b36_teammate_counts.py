@@ -0,0 +1,40 @@
+"""teammate_counts table
+
+Revision ID: e5a9d2174b36
+Revises: d7c30e58f4a1
+Create Date: 2019-05-29 20:31:17.902446
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9d2174b36'
+down_revision = 'd7c30e58f4a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('teammate_counts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('teammate_id', sa.Integer(), nullable=False),
+    sa.Column('shared_teams', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['teammate_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'teammate_id')
+    )
+    op.create_index('ix_teammate_counts_user_id_shared_teams', 'teammate_counts', ['user_id', sa.text('shared_teams DESC')], unique=False)
+    op.execute(
+        'INSERT INTO teammate_counts (user_id, teammate_id, shared_teams) '
+        'SELECT target.paricipant_id, teammate.paricipant_id, count(*) '
+        'FROM teamparticipants AS target JOIN teamparticipants AS teammate ON target.team_id = teammate.team_id '
+        'WHERE target.paricipant_id != teammate.paricipant_id '
+        'GROUP BY target.paricipant_id, teammate.paricipant_id'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_teammate_counts_user_id_shared_teams', table_name='teammate_counts')
+    op.drop_table('teammate_counts')
@@ -0,0 +1,24 @@
+"""indexes for the teams of a user
+
+Revision ID: f18b6c0e93d7
+Revises: e5a9d2174b36
+Create Date: 2019-05-31 17:48:26.331759
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f18b6c0e93d7'
+down_revision = 'e5a9d2174b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_teamparticipants_paricipant_id_team_id', 'teamparticipants', ['paricipant_id', 'team_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_teamparticipants_paricipant_id_team_id', table_name='teamparticipants')
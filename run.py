@@ -1,4 +1,5 @@
+import os
 from app import app, sockets
 
 if __name__ == '__main__':
-    sockets.run(app, debug=True)
+    sockets.run(app, debug=True, port=int(os.getenv('PORT', 5000)))